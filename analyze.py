@@ -7,53 +7,43 @@
 #import tensorflow
 import argparse
 import csv
+import heapq
+import json
 import logging
+import math
 import pickle
 import sys
-from typing import Dict, List, Tuple
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
 
 from nltk import ngrams  # type: ignore
 from nltk.corpus import stopwords  # type: ignore
 
+import rowindex
+import spill
+import sstable
+from mine import aggregate_path, gram_key, topic_path
+
 MAX_TWEETS = -1
 DIVISION = 25
 REPORT_LIMIT = 25
+Z_95 = 1.96
+
 
+def analyze_tweets(
+    tweetin: str, gramin: str, output: str = "", topics: Optional[List[str]] = None
+) -> None:
+    """Analyze Tweets using prior knowledge.
 
-def analyze_tweets(tweetin: str, gramin: str, output: str = "") -> None:
-    """Analyze Tweets using prior knowledge."""
+    If topics are given, each also gets its own report, from the topic's
+    n-grams at topic_path(gramin) to topic_path(output). The Tweets are
+    only loaded and mapped to aspects once for every report.
+    """
     logger = logging.getLogger("analyzer")
 
     logger.info("Unpickling Tweets")
     tweets = pickle.load(open(tweetin, "rb"))
 
-    logger.info("Unpickling n-grams")
-    gram_scores = pickle.load(open(gramin, "rb"))
-
-    logger.info("Initializing aspect sentiments")
-    tweets_written = 1
-    aspects: List[Dict[str, Aspect]] = [{}, {}, {}, {}, {}]
-    for i in range(1, 5):
-        for aspect, count in gram_scores[i].items():
-            aspects[i][aspect] = Aspect(aspect, count)
-
-    logger.info("Mapping ngram aspects to sentiments")
-    for tweet in tweets:
-        if tweet.positivity > tweet.negativity:
-            for i in range(1, 5):
-                grams = ngrams(tweet.cleaned_tokens, i)
-                for gram in grams:
-                    aspects[i][gram].positive += 1
-        else:
-            for i in range(1, 5):
-                grams = ngrams(tweet.cleaned_tokens, i)
-                for gram in grams:
-                    aspects[i][gram].negative += 1
-
-        if not tweets_written % DIVISION:
-            logger.info("Analyzed tweet #%s", tweets_written)
-        tweets_written += 1
-
     # Create stop words list for presentation. These will only be
     # used to filter out 1- and 2-grams. They provide more useful
     # context in 3- and 4-grams, though
@@ -83,28 +73,117 @@ def analyze_tweets(tweetin: str, gramin: str, output: str = "") -> None:
     for stop in alt_stops:
         stop_words.append(stop)
 
+    # Reports keyed by topic ("" being every Tweet)
+    names = ["", *(topics or [])]
+    members: Dict[str, List[Tweet]] = {name: [] for name in names}
+    aspects: Dict[str, List[Dict[Tuple[str, ...], Aspect]]] = {}
+    designs: Dict[str, Dict[str, int]] = {}
+
+    # Aspects whose sentiments still have to be counted from the Tweets
+    mapped: Dict[str, List[Dict[Tuple[str, ...], Aspect]]] = {}
+
+    logger.info("Initializing aspect sentiments")
+    for name in names:
+        path = topic_path(gramin, name) if name else gramin
+        logger.info("Unpickling n-grams from %s", path)
+        gram_scores = pickle.load(open(path, "rb"))
+
+        # Sampling design of a preview run from mine.py, if any
+        designs[name] = gram_scores[0] if "sample" in gram_scores[0] else {}
+
+        # Totals aggregated on disk by mine.py already carry sentiments,
+        # so only the aspects the report can show are loaded
+        if gram_scores[0].get("aggregate"):
+            logger.info("Loading report candidates from on-disk n-gram totals")
+            aspects[name] = load_candidates(aggregate_path(path), str(stop_words))
+        else:
+            aspects[name] = [{}, {}, {}, {}, {}]
+            for i in range(1, 5):
+                for aspect, count in gram_scores[i].items():
+                    aspects[name][i][aspect] = Aspect(aspect, count)
+            mapped[name] = aspects[name]
+
+    logger.info("Mapping ngram aspects to sentiments")
+    tweets_written = 1
+    for tweet in tweets:
+        positive = tweet.positivity > tweet.negativity
+        for name in ["", *tweet.topics]:
+            if name not in members:
+                continue
+            members[name].append(tweet)
+            if name not in mapped:
+                continue
+
+            for i in range(1, 5):
+                for gram, occurrences in Counter(ngrams(tweet.cleaned_tokens, i)).items():
+                    aspect = mapped[name][i][gram]
+                    if positive:
+                        aspect.positive += occurrences
+                    else:
+                        aspect.negative += occurrences
+
+                    # Occurrences cluster within Tweets, so a preview's
+                    # error estimates are based on the Tweets with an aspect
+                    aspect.tweets += 1
+                    aspect.positive_tweets += positive
+                    aspect.squares += occurrences ** 2
+
+        if not tweets_written % DIVISION:
+            logger.info("Analyzed tweet #%s", tweets_written)
+        tweets_written += 1
+
+    for name in names:
+        if name:
+            print()
+            logger.info("Analyzing %s Tweets tagged '%s'", len(members[name]), name)
+        report(
+            members[name],
+            aspects[name],
+            designs[name],
+            str(stop_words),
+            topic_path(output, name) if output and name else output,
+        )
+
+
+def report(
+    tweets: List["Tweet"],
+    aspects: List[Dict[Tuple[str, ...], "Aspect"]],
+    design: Dict[str, int],
+    stops: str,
+    output: str,
+) -> None:
+    """Log the top aspects of each size, and export them if output is given."""
+    logger = logging.getLogger("analyzer")
+
+    if design:
+        logger.info(
+            "Preview from %s of %s rows: counts are scaled estimates with 95%% intervals",
+            design["sample"],
+            design["population"],
+        )
+
+    # Overall positivity, which is all a preview may need
+    positive_tweets = sum(tweet.positivity > tweet.negativity for tweet in tweets)
+    low, high = wilson_interval(positive_tweets, len(tweets))
+    logger.info(
+        "%s of %s Tweets positive (%5.1f%%, 95%% interval %5.1f%% - %5.1f%%)",
+        positive_tweets,
+        len(tweets),
+        100 * positive_tweets / max(1, len(tweets)),
+        100 * low,
+        100 * high,
+    )
+
     # Output 1-grams but without stop-words
     print()
     attempt = j = 0
     sorted_grams = sorted(aspects[1], key=aspects[1].get, reverse=True)
     logger.info("Top 25 1-grams (stop-words removed):")
-    logger.info("|             %s-gram             | Count |  Positivity  |  Negativity  |", i)
+    logger.info("|             %s-gram             | Count |  Positivity  |  Negativity  |", 1)
     logger.info("- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -")
     while j < REPORT_LIMIT and attempt < len(sorted_grams):
-        if sorted_grams[attempt][0].lower() not in str(stop_words):
-            aspect = sorted_grams[attempt][0]
-            count = aspects[1][sorted_grams[attempt]].count
-            positive = aspects[1][sorted_grams[attempt]].positive
-            negative = aspects[1][sorted_grams[attempt]].negative
-            logger.info(
-                "| %30s | %5s | %3s (%5.4s%%) | %3s (%5.4s%%) |",
-                aspect,
-                count,
-                positive,
-                100 * (positive / count),
-                negative,
-                100 * (negative / count),
-            )
+        if sorted_grams[attempt][0].lower() not in stops:
+            log_aspect(sorted_grams[attempt][0], aspects[1][sorted_grams[attempt]], design)
             j += 1
         attempt += 1
 
@@ -114,20 +193,8 @@ def analyze_tweets(tweetin: str, gramin: str, output: str = "") -> None:
         sorted_grams = sorted(aspects[i], key=aspects[i].get, reverse=True)
         logger.info("|             %s-gram             | Count |  Positivity  |  Negativity  |", i)
         logger.info("- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - ")
-        for j in range(REPORT_LIMIT):
-            aspect = " ".join(sorted_grams[j])
-            count = aspects[i][sorted_grams[j]].count
-            positive = aspects[i][sorted_grams[j]].positive
-            negative = aspects[i][sorted_grams[j]].negative
-            logger.info(
-                "| %30s | %5s | %3s (%5.4s%%) | %3s (%5.4s%%) |",
-                aspect,
-                count,
-                positive,
-                100 * (positive / count),
-                negative,
-                100 * (negative / count),
-            )
+        for j in range(min(REPORT_LIMIT, len(sorted_grams))):
+            log_aspect(" ".join(sorted_grams[j]), aspects[i][sorted_grams[j]], design)
 
     # Export to .CSV file if specified
     if output:
@@ -151,6 +218,7 @@ def analyze_tweets(tweetin: str, gramin: str, output: str = "") -> None:
                         100 * (aspect.positive / aspect.count),
                         100 * (aspect.negative / aspect.count),
                     ]
+                    + (estimate_columns(aspect, design) if design else [])
                 )
             if counter == REPORT_LIMIT:
                 break
@@ -159,6 +227,131 @@ def analyze_tweets(tweetin: str, gramin: str, output: str = "") -> None:
     logger.info("File report created" if output else "Done!")
 
 
+def load_candidates(aggin: str, stops: str) -> List[Dict[Tuple[str, ...], "Aspect"]]:
+    """Load the aspects a report can show from on-disk n-gram totals.
+
+    Only the REPORT_LIMIT + 1 most frequent n-grams of each size (and
+    the REPORT_LIMIT most frequent 1-grams that aren't stop-words) are
+    kept. They are inserted in the order they were first seen, so ties
+    sort exactly as they would in an in-memory run.
+    """
+    aspects: List[Dict[Tuple[str, ...], Aspect]] = [{}, {}, {}, {}, {}]
+    kept: List[List[Tuple[int, int, List[str], int, int]]] = [[], [], [], [], []]
+    unstopped: List[Tuple[int, int, List[str], int, int]] = []
+
+    # Bounded min-heaps ranked by count, then earliest first seen
+    for key, count, positive, negative, first in spill.read_records(aggin):
+        size, *gram = json.loads(key)
+        entry = (count, -first, gram, positive, negative)
+        heaps = [(kept[size], REPORT_LIMIT + 1)]
+        if size == 1 and gram[0].lower() not in stops:
+            heaps.append((unstopped, REPORT_LIMIT))
+        for heap, limit in heaps:
+            if len(heap) < limit:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+
+    kept[1] += unstopped
+    for size in range(1, 5):
+        for count, _, gram, positive, negative in sorted(kept[size], key=lambda e: -e[1]):
+            aspect = Aspect(tuple(gram), count)
+            aspect.positive = positive
+            aspect.negative = negative
+            aspects[size][aspect.aspect] = aspect
+
+    return aspects
+
+
+def log_aspect(text: str, aspect: "Aspect", design: Dict[str, int]) -> None:
+    """Log one report row, with error estimates for a preview run."""
+    logger = logging.getLogger("analyzer")
+
+    if not design:
+        logger.info(
+            "| %30s | %5s | %3s (%5.4s%%) | %3s (%5.4s%%) |",
+            text,
+            aspect.count,
+            aspect.positive,
+            100 * (aspect.positive / aspect.count),
+            aspect.negative,
+            100 * (aspect.negative / aspect.count),
+        )
+        return
+
+    count, margin, low, high = estimate_columns(aspect, design)
+    logger.info(
+        "| %30s | ~%5.0f +- %-5.0f | %5.1f%% [%5.1f, %5.1f] | %5.1f%% [%5.1f, %5.1f] |",
+        text,
+        count,
+        margin,
+        100 * (aspect.positive / aspect.count),
+        100 * low,
+        100 * high,
+        100 * (aspect.negative / aspect.count),
+        100 * (1 - high),
+        100 * (1 - low),
+    )
+
+
+def estimate_columns(aspect: "Aspect", design: Dict[str, int]) -> List[float]:
+    """Estimate an aspect's full count and positivity from a sample.
+
+    The count is scaled up by population / sample. Its margin comes from
+    the variance of the aspect's occurrences per sampled Tweet (finite
+    population corrected), and positivity gets a Wilson interval over
+    the positive Tweets among those containing the aspect rather than
+    over its occurrences, since every occurrence in a Tweet shares that
+    Tweet's sentiment.
+
+    Totals aggregated on disk carry no per-Tweet counts, so for those
+    occurrences are treated as independent (a Poisson margin) and the
+    intervals come out too narrow for aspects repeated within Tweets.
+    """
+    sample, population = design["sample"], design["population"]
+    scale = population / sample
+    correction = (population - sample) / max(1, population - 1)
+
+    if aspect.tweets:
+        variance = max(0.0, aspect.squares - aspect.count ** 2 / sample) / max(1, sample - 1)
+        margin = Z_95 * population * math.sqrt(variance * correction / sample)
+        low, high = wilson_interval(aspect.positive_tweets, aspect.tweets)
+    else:
+        margin = Z_95 * math.sqrt(aspect.count * correction) * scale
+        low, high = wilson_interval(aspect.positive, aspect.count)
+
+    return [aspect.count * scale, margin, low, high]
+
+
+def wilson_interval(successes: int, trials: int) -> Tuple[float, float]:
+    """Return the 95% Wilson score interval of a proportion."""
+    if not trials:
+        return 0.0, 1.0
+
+    share = successes / trials
+    denominator = 1 + Z_95 ** 2 / trials
+    centre = (share + Z_95 ** 2 / (2 * trials)) / denominator
+    spread = Z_95 * math.sqrt(share * (1 - share) / trials + Z_95 ** 2 / (4 * trials ** 2))
+    return max(0.0, centre - spread / denominator), min(1.0, centre + spread / denominator)
+
+
+def fetch_examples(
+    postingin: str, source: str, aspect: str, limit: int = REPORT_LIMIT
+) -> List[List[str]]:
+    """Fetch the rows of source containing an aspect via the inverted index."""
+    gram = tuple(aspect.lower().split())
+    table = sstable.Table(postingin)
+    packed = table.get(gram_key(len(gram), gram))
+    table.close()
+
+    if packed is None:
+        return []
+
+    # Seek to each posted row rather than scanning the source
+    row_index = rowindex.RowIndex(source)
+    return [next(row_index.rows(row, row + 1)) for row in sstable.unpack_ids(packed)[:limit]]
+
+
 class Aspect:
     """Record for aspect."""
 
@@ -169,6 +362,12 @@ class Aspect:
         self.positive = 0
         self.negative = 0
 
+        # Tweets containing the aspect, and the sum of its squared
+        # occurrences per Tweet, for error estimates on previews
+        self.tweets = 0
+        self.positive_tweets = 0
+        self.squares = 0
+
     def __lt__(self, other) -> bool:  # type: ignore
         """Overload less-than operator."""
         return self.count < other.count  # type: ignore
@@ -198,6 +397,10 @@ class Tweet:
         self.user_tweet_count = tweet_row[15]
         self.cleaned_text = tweet_row[16]
         self.cleaned_tokens = json.loads(tweet_row[17])
+        self.topics = json.loads(tweet_row[18]) if len(tweet_row) > 18 else []
+        self.prefilter = None
+        if len(tweet_row) > 19 and tweet_row[19]:
+            self.prefilter = json.loads(tweet_row[19])
 
         self.positivity = -1
         self.negativity = -1
@@ -207,17 +410,35 @@ class Tweet:
 def main() -> int:
     """Execute standalone."""
     arg_p = argparse.ArgumentParser()
-    arg_p.add_argument("tweetin", help="input Tweet pickle")
-    arg_p.add_argument("gramin", help="input Gram pickle")
+    arg_p.add_argument("tweetin", nargs="?", help="input Tweet pickle")
+    arg_p.add_argument("gramin", nargs="?", help="input Gram pickle")
     arg_p.add_argument("--output", help="optional output")
+    arg_p.add_argument("--postings", help="n-gram inverted index from mine.py")
+    arg_p.add_argument("--source", help="the .CSV file mine.py read, for --aspect")
+    arg_p.add_argument("--aspect", help="only print example Tweets for this n-gram")
+    arg_p.add_argument("--topics", nargs="*", help="also report these topics from mine.py --topics")
 
     args = arg_p.parse_args()
 
+    if not args.aspect and (not args.tweetin or not args.gramin):
+        arg_p.error("tweetin and gramin are required unless --aspect is given")
+
     logging.basicConfig(
         level=logging.INFO, format="[%(levelname)s | %(name)s] %(message)s",
     )
 
-    analyze_tweets(args.tweetin, args.gramin, args.output)
+    # Drill down into a single aspect without a full analysis
+    if args.aspect:
+        if not args.postings or not args.source:
+            arg_p.error("--aspect needs --postings and --source")
+        logger = logging.getLogger("analyzer")
+        examples = fetch_examples(args.postings, args.source, args.aspect)
+        logger.info("%s example Tweets for '%s':", len(examples), args.aspect)
+        for row in examples:
+            logger.info("| %s | %s", row[3], " ".join(row[0].split()))
+        return 0
+
+    analyze_tweets(args.tweetin, args.gramin, args.output, args.topics)
 
     return 0
 
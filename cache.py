@@ -0,0 +1,161 @@
+"""Stage output cache module."""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from types import ModuleType
+from typing import Any, Callable, Dict, List, Optional
+
+CACHE_DIR = ".plumage_cache"
+CACHE_LIMIT = 2 ** 30
+CHUNK = 1 << 20
+
+
+def cached(
+    stage: str,
+    function: Callable[[], None],
+    inputs: List[str],
+    outputs: List[str],
+    params: Dict[str, Any],
+    modules: List[ModuleType],
+) -> bool:
+    """Run a stage unless its outputs for these inputs are already cached.
+
+    The cache key covers the content of every input file, the source of
+    every module the stage runs, and its parameters, so any change to
+    those reruns the stage. Returns whether it was a cache hit.
+    """
+    logger = logging.getLogger("cache")
+    key = fingerprint(stage, inputs, params, modules)
+
+    if restore(key, outputs):
+        logger.info("Cache hit for %s (%s) - skipping", stage, key[:12])
+        return True
+
+    logger.info("Cache miss for %s (%s)", stage, key[:12])
+    function()
+    store(key, outputs)
+    return False
+
+
+def fingerprint(
+    stage: str, inputs: List[str], params: Dict[str, Any], modules: List[ModuleType]
+) -> str:
+    """Hash everything a stage's outputs depend on."""
+    digest = hashlib.sha256(stage.encode("utf-8"))
+
+    for path in inputs:
+        digest.update(file_hash(path).encode("utf-8"))
+    for module in modules:
+        digest.update(file_hash(module.__file__).encode("utf-8"))  # type: ignore
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode("utf-8"))
+
+    return digest.hexdigest()
+
+
+def file_hash(path: str) -> str:
+    """Return the SHA-256 of a file, remembered while its size and mtime hold."""
+    stat = os.stat(path)
+    stamp = [stat.st_size, stat.st_mtime_ns]
+
+    # Rehashing large unchanged inputs on every run would defeat the point
+    known = _load_json(os.path.join(CACHE_DIR, "hashes.json")) or {}
+    entry = known.get(os.path.abspath(path))
+    if entry and entry[:2] == stamp:
+        return entry[2]  # type: ignore
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as in_fp:
+        for chunk in iter(lambda: in_fp.read(CHUNK), b""):
+            digest.update(chunk)
+
+    known[os.path.abspath(path)] = stamp + [digest.hexdigest()]
+    _save_json(os.path.join(CACHE_DIR, "hashes.json"), known)
+    return digest.hexdigest()
+
+
+def restore(key: str, outputs: List[str]) -> bool:
+    """Copy a cached entry's blobs to the output paths, if it exists."""
+    entry_path = os.path.join(CACHE_DIR, "entries", key + ".json")
+    blobs = _load_json(entry_path)
+    if blobs is None or len(blobs) != len(outputs):
+        return False
+    if not all(os.path.exists(_blob_path(blob)) for blob in blobs):
+        return False
+
+    for blob, output in zip(blobs, outputs):
+        shutil.copyfile(_blob_path(blob), output)
+
+    # Mark as recently used for eviction
+    os.utime(entry_path)
+    return True
+
+
+def store(key: str, outputs: List[str]) -> None:
+    """Store outputs as content-addressed blobs under a key, then evict."""
+    blobs = []
+
+    for output in outputs:
+        blob = file_hash(output)
+        if not os.path.exists(_blob_path(blob)):
+            os.makedirs(os.path.dirname(_blob_path(blob)), exist_ok=True)
+            shutil.copyfile(output, _blob_path(blob) + ".tmp")
+            os.replace(_blob_path(blob) + ".tmp", _blob_path(blob))
+        blobs.append(blob)
+
+    os.makedirs(os.path.join(CACHE_DIR, "entries"), exist_ok=True)
+    _save_json(os.path.join(CACHE_DIR, "entries", key + ".json"), blobs)
+    evict(CACHE_LIMIT)
+
+
+def evict(limit: int) -> None:
+    """Drop least recently used entries until the blobs fit in limit bytes."""
+    logger = logging.getLogger("cache")
+    entry_dir = os.path.join(CACHE_DIR, "entries")
+    entries = sorted(
+        (os.path.join(entry_dir, name) for name in os.listdir(entry_dir)),
+        key=os.path.getmtime,
+    )
+
+    # Blobs can be shared, so only count and free unreferenced ones
+    references: Dict[str, int] = {}
+    for entry in entries:
+        for blob in _load_json(entry) or []:
+            references[blob] = references.get(blob, 0) + 1
+    total = sum(
+        os.path.getsize(_blob_path(blob)) for blob in references if os.path.exists(_blob_path(blob))
+    )
+
+    while total > limit and entries:
+        entry = entries.pop(0)
+        for blob in _load_json(entry) or []:
+            references[blob] -= 1
+            if not references[blob] and os.path.exists(_blob_path(blob)):
+                total -= os.path.getsize(_blob_path(blob))
+                os.remove(_blob_path(blob))
+        os.remove(entry)
+        logger.info("Evicted %s", os.path.basename(entry))
+
+
+def _blob_path(blob: str) -> str:
+    """Return where a blob is stored."""
+    return os.path.join(CACHE_DIR, "objects", blob[:2], blob)
+
+
+def _load_json(path: str) -> Optional[Any]:
+    """Load a JSON file, or None if it is missing or unreadable."""
+    try:
+        with open(path, "r", encoding="utf-8") as in_fp:
+            return json.load(in_fp)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_json(path: str, value: Any) -> None:
+    """Atomically write a JSON file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as out_fp:
+        json.dump(value, out_fp)
+    os.replace(path + ".tmp", path)
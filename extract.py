@@ -4,16 +4,37 @@
 #import tensorflow
 import argparse
 import csv
+import json
 import logging
 import os
+import re
 import sys
 import time
+from typing import Dict, List, Optional, Set, Tuple
 
 import tweepy  # type: ignore
 
+import rowindex
 
-def extract_tweets(secret: str, query: str, outfile: str, count: int = 0, wait: int = 300) -> None:
-    """Extract Tweets using the Tweepy API."""
+MAX_QUERY = 500
+
+
+def extract_tweets(
+    secret: str,
+    query: str,
+    outfile: str,
+    count: int = 0,
+    wait: int = 300,
+    topics: Optional[List[str]] = None,
+) -> None:
+    """Extract Tweets using the Tweepy API.
+
+    If topics are given, query is ignored: the topics are OR-ed into as
+    few searches as possible and every row gets a trailing column
+    listing the topics it matches, so each Tweet is only stored once.
+    Cursors are kept per topic, so changing the topics doesn't lose the
+    progress of the ones that stay.
+    """
     logger = logging.getLogger("extracter")
     logger.info("Authenticating with Tweepy")
 
@@ -30,6 +51,7 @@ def extract_tweets(secret: str, query: str, outfile: str, count: int = 0, wait:
     logger.info("Authenticated! Examining outfile.")
     if not os.path.exists(outfile):
         logger.info("%s doesn't exist - it will be created.", outfile)
+        reset_sidecars(outfile)
         file_p = open(outfile, "w", encoding="utf-8")
         tweet_writer = csv.writer(file_p)
         tweet_writer.writerow(
@@ -51,13 +73,33 @@ def extract_tweets(secret: str, query: str, outfile: str, count: int = 0, wait:
                 "user_verified",
                 "user_tweet_count",
             ]
+            + (["topics"] if topics else [])
         )
     else:
         logger.info("%s exists - will append.", outfile)
         file_p = open(outfile, "a", encoding="utf-8")
         tweet_writer = csv.writer(file_p)
 
-    logger.info("Starting Tweet extraction for query '%s'", query)
+    # Cursor state and id index live next to the outfile so a
+    # restarted extractor only spends requests on unseen ranges
+    cursors = load_cursors(cursor_path(outfile))
+
+    # One search per chunk of topics, or just the query
+    searches = build_queries(topics, cursors) if topics else [(query, [query])]
+    seen = load_seen_ids(ids_path(outfile), outfile)
+    index_fp = open(ids_path(outfile), "a", encoding="utf-8")
+    logger.info("Loaded %s known Tweet ids", len(seen))
+
+    # Byte offsets of each row, extended as pages are appended
+    file_p.flush()
+    row_index = rowindex.RowIndex(outfile)
+
+    # Catch up on anything newer than the last run before backfilling
+    backfill = {search: "newest" not in cursors.get(keys[0], {}) for search, keys in searches}
+    untagged = 0
+
+    for search, _ in searches:
+        logger.info("Starting Tweet extraction for query '%s'", search)
 
     if not count:
         logger.info("(executing forever)")
@@ -65,9 +107,12 @@ def extract_tweets(secret: str, query: str, outfile: str, count: int = 0, wait:
         logger.info("(executing %s times)", count)
 
     i = 1
-    bookmark = "1"
 
     while True:
+        # Take turns between the searches
+        search, keys = searches[(i - 1) % len(searches)]
+        cursor = dict(cursors.get(keys[0], {}))
+
         # Our search query.
         #
         # q - search query. We use the -filter:retweets
@@ -87,45 +132,72 @@ def extract_tweets(secret: str, query: str, outfile: str, count: int = 0, wait:
         # result_type - we use recent so as to create
         #     a chronological record of Tweets
         #
-        # since_id - we keep track of the last Tweet
-        #     saved and use it as a bookmark in order
-        #     to only get the Tweets coming after it
+        # since_id/max_id - bound the page to the id
+        #     range we have not seen yet (see next_page)
         #
-        for tweet in api.search(
-            q=f"{query} -filter:retweets",
+        bounds = next_page(cursor, backfill[search])
+        page = api.search(
+            q=f"{search} -filter:retweets",
             lang="en",
             count=100,
             tweet_mode="extended",
             result_type="recent",
-            max_id=bookmark,
-        ):
+            **bounds,
+        )
+        ids = [int(tweet.id_str) for tweet in page]
+
+        for tweet in page:
+            # Skip anything an earlier run already wrote
+            if tweet.id_str in seen:
+                continue
+
             # These are the features we write
-            tweet_writer.writerow(
-                [
-                    tweet.full_text,
-                    tweet.created_at,
-                    tweet.source,
-                    tweet.id_str,
-                    tweet.retweet_count,
-                    tweet.favorite_count,
-                    tweet.user.name,
-                    tweet.user.id_str,
-                    tweet.user.screen_name,
-                    tweet.user.location,
-                    tweet.user.description,
-                    tweet.user.protected,
-                    tweet.user.followers_count,
-                    tweet.user.created_at,
-                    tweet.user.verified,
-                    tweet.user.statuses_count,
-                ]
-            )
+            row = [
+                tweet.full_text,
+                tweet.created_at,
+                tweet.source,
+                tweet.id_str,
+                tweet.retweet_count,
+                tweet.favorite_count,
+                tweet.user.name,
+                tweet.user.id_str,
+                tweet.user.screen_name,
+                tweet.user.location,
+                tweet.user.description,
+                tweet.user.protected,
+                tweet.user.followers_count,
+                tweet.user.created_at,
+                tweet.user.verified,
+                tweet.user.statuses_count,
+            ]
+
+            # Tag the Tweet with every topic it matches
+            if topics:
+                matched = match_topics(tweet.full_text, topics)
+                untagged += not matched
+                row.append(json.dumps(matched))
+
+            tweet_writer.writerow(row)
 
             # Flush the stream every time just in case
             file_p.flush()
 
-            # Set the most recent Tweet as a bookmark
-            bookmark = tweet.id_str
+            # Record the id only once its row is on disk
+            seen.add(tweet.id_str)
+            index_fp.write(tweet.id_str + "\n")
+            index_fp.flush()
+
+        # Keep the row index in step with the appended rows
+        row_index.refresh()
+
+        # Move the cursor past this page and persist it
+        backfill[search] = advance_cursor(cursor, backfill[search], ids)
+        for key in keys:
+            cursors[key] = dict(cursor)
+        save_cursors(cursor_path(outfile), cursors)
+
+        if untagged:
+            logger.info("%s Tweets so far matched no topic", untagged)
 
         # Transparency/monitoring
         limits = api.rate_limit_status()
@@ -140,6 +212,175 @@ def extract_tweets(secret: str, query: str, outfile: str, count: int = 0, wait:
         # Respect API
         time.sleep(wait)
 
+    index_fp.close()
+    file_p.close()
+
+
+def build_queries(
+    topics: List[str], cursors: Dict[str, Dict[str, int]]
+) -> List[Tuple[str, List[str]]]:
+    """OR topics together into as few searches as fit in MAX_QUERY.
+
+    Only topics at the same cursor share a search, so a newly added
+    topic catches up on its own. Returns each search with its topics.
+    """
+    groups: Dict[str, List[str]] = {}
+    for topic in topics:
+        groups.setdefault(json.dumps(cursors.get(topic, {}), sort_keys=True), []).append(topic)
+
+    searches: List[Tuple[str, List[str]]] = []
+    budget = MAX_QUERY - len(" -filter:retweets")
+
+    for group in groups.values():
+        first = len(searches)
+        for topic in group:
+            term = f"({topic})" if " " in topic.strip() else topic.strip()
+            if len(searches) > first and len(searches[-1][0]) + len(" OR ") + len(term) <= budget:
+                searches[-1] = (searches[-1][0] + " OR " + term, searches[-1][1] + [topic])
+            else:
+                searches.append((term, [topic]))
+
+    return searches
+
+
+def match_topics(full_text: str, topics: List[str]) -> List[str]:
+    """Return the topics whose words all occur in a Tweet.
+
+    Hashtags match both with their words run together and split at
+    capitals, so "#stayhome" and "#StayHome" match the topic "stay home".
+    """
+    words = set(re.findall(r"\w+", full_text.lower()))
+    for hashtag in re.findall(r"#(\w+)", full_text):
+        parts = re.findall(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+", hashtag)
+        words.update(part.lower() for part in parts)
+
+    matched = []
+    for topic in topics:
+        terms = re.findall(r"\w+", topic.lower())
+        if set(terms) <= words or "".join(terms) in words:
+            matched.append(topic)
+    return matched
+
+
+def cursor_path(outfile: str) -> str:
+    """Return the path of the cursor state kept beside an outfile."""
+    return outfile + ".cursor"
+
+
+def ids_path(outfile: str) -> str:
+    """Return the path of the Tweet id index kept beside an outfile."""
+    return outfile + ".ids"
+
+
+def reset_sidecars(outfile: str) -> None:
+    """Remove cursor state and ids left behind by a deleted outfile.
+
+    They describe Tweets the new outfile doesn't have, so trusting them
+    would skip those Tweets for good.
+    """
+    for path in [cursor_path(outfile), ids_path(outfile)]:
+        if os.path.exists(path):
+            logging.getLogger("extracter").info("Discarding stale %s", path)
+            os.remove(path)
+
+
+def load_cursors(path: str) -> Dict[str, Dict[str, int]]:
+    """Load per-query (or per-topic) cursor state, or nothing if there is none yet."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as cursor_fp:
+        return json.load(cursor_fp)  # type: ignore
+
+
+def save_cursors(path: str, cursors: Dict[str, Dict[str, int]]) -> None:
+    """Atomically persist per-query (or per-topic) cursor state."""
+    with open(path + ".tmp", "w", encoding="utf-8") as cursor_fp:
+        json.dump(cursors, cursor_fp)
+        cursor_fp.flush()
+        os.fsync(cursor_fp.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def load_seen_ids(path: str, outfile: str) -> Set[str]:
+    """Load the on-disk id index, rebuilding it from the outfile if missing."""
+    seen: Set[str] = set()
+
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as index_fp:
+            for line in index_fp:
+                seen.add(line.strip())
+        return seen
+
+    # Older outfiles predate the index, so derive it from their rows
+    if os.path.exists(outfile):
+        with open(outfile, "r", encoding="utf-8") as csv_file:
+            for row in csv.reader(csv_file):
+                if len(row) > 3 and row[3].isdigit():
+                    seen.add(row[3])
+        with open(path, "w", encoding="utf-8") as index_fp:
+            for tweet_id in seen:
+                index_fp.write(tweet_id + "\n")
+
+    return seen
+
+
+def next_page(cursor: Dict[str, int], backfill: bool) -> Dict[str, int]:
+    """Return the since_id/max_id bounds of the next unseen page.
+
+    Cursor keys:
+
+    newest/oldest - the contiguous id range already extracted
+
+    gap_top/gap_max - progress through the range newer than newest,
+        which is paged downwards and only merged into newest once
+        it has been exhausted, so a crash mid-way leaves no hole
+
+    exhausted - set once backfilling found nothing older, after which
+        only newer pages are requested
+    """
+    bounds: Dict[str, int] = {}
+
+    if backfill:
+        if "oldest" in cursor:
+            bounds["max_id"] = cursor["oldest"] - 1
+    else:
+        bounds["since_id"] = cursor["newest"]
+        if "gap_max" in cursor:
+            bounds["max_id"] = cursor["gap_max"]
+
+    return bounds
+
+
+def advance_cursor(cursor: Dict[str, int], backfill: bool, ids: List[int]) -> bool:
+    """Fold a fetched page into the cursor and return the next direction."""
+    if backfill:
+        # Nothing older is searchable, so stop backfilling for good
+        if not ids:
+            if "newest" in cursor:
+                cursor["exhausted"] = 1
+            return "newest" not in cursor
+        cursor["oldest"] = min(ids + [cursor.get("oldest", min(ids))])
+        cursor["newest"] = max(ids + [cursor.get("newest", max(ids))])
+        return True
+
+    # The gap above newest is closed, so it can be merged in
+    if not ids:
+        if "gap_top" in cursor:
+            cursor["newest"] = cursor.pop("gap_top")
+        cursor.pop("gap_max", None)
+        return "exhausted" not in cursor
+
+    cursor["gap_top"] = max(ids + [cursor.get("gap_top", max(ids))])
+    cursor["gap_max"] = min(ids) - 1
+
+    # Don't spend a request confirming a gap we already reached the bottom of
+    if cursor["gap_max"] <= cursor["newest"]:
+        cursor["newest"] = cursor.pop("gap_top")
+        cursor.pop("gap_max")
+        return "exhausted" not in cursor
+
+    return False
+
 
 def main() -> int:
     """Execute standalone."""
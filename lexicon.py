@@ -0,0 +1,211 @@
+"""Lexicon module."""
+# pylint: disable=C0330
+
+#import tensorflow
+import argparse
+import logging
+import os
+import sys
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import nltk  # type: ignore
+from nltk.corpus import twitter_samples  # type: ignore
+from nltk.stem.wordnet import WordNetLemmatizer  # type: ignore
+from nltk.tag import pos_tag as nltk_pos_tag  # type: ignore
+from nltk.tokenize import word_tokenize  # type: ignore
+
+import rowindex
+import sstable
+
+MIN_COUNT = 2
+TAG_AGREEMENT = 1.0
+HOLDOUT = 10
+DIVISION = 1000
+
+# Entry keys: b"t\0<token>" -> tag and b"l\0<pos>\0<token>" -> lemma
+TAG_PREFIX = b"t\0"
+LEMMA_PREFIX = b"l\0"
+
+_table: Optional[sstable.Table] = None
+_lemmatizer = WordNetLemmatizer()
+
+# Posts tagged from the lexicon and by NLTK since the lexicon was loaded
+usage: Counter = Counter()  # type: ignore
+
+
+def load(path: str) -> None:
+    """Use a compiled lexicon for subsequent lookups."""
+    global _table  # pylint: disable=W0603
+    if os.path.exists(path):
+        _table = sstable.Table(path)
+        logging.getLogger("lexicon").info("Loaded %s lexicon entries from %s", len(_table), path)
+    elif path:
+        logging.getLogger("lexicon").warning("No lexicon at %s - tagging with NLTK only", path)
+
+
+def loaded_path() -> str:
+    """Return the path of the lexicon in use, if any."""
+    return _table.path if _table is not None else ""
+
+
+def pos_tag(tokens: List[str]) -> List[Tuple[str, str]]:
+    """Tag tokens from the lexicon, falling back to NLTK on any miss.
+
+    Only tokens that got the same tag in every context of the build
+    corpus are compiled, and a post is only tagged from the lexicon if
+    every one of its tokens is. This approximates NLTK: a compiled token
+    can still be tagged differently in a context the corpus never had
+    (build_lexicon logs how often that happened on held-out posts).
+
+    Any miss tags the whole post with NLTK, so the perceptron model is
+    still loaded by the first post with an uncompiled token.
+    """
+    if _table is not None:
+        tagged = []
+        for token in tokens:
+            tag = _table.get(TAG_PREFIX + token.encode("utf-8"))
+            if tag is None:
+                break
+            tagged.append((token, tag.decode("utf-8")))
+        else:
+            usage["lexicon"] += 1
+            return tagged
+        usage["nltk"] += 1
+
+    return nltk_pos_tag(tokens)  # type: ignore
+
+
+def log_usage() -> None:
+    """Log how many posts the lexicon tagged without NLTK."""
+    if _table is not None:
+        logging.getLogger("lexicon").info(
+            "Tagged %s posts from the lexicon and %s with NLTK", usage["lexicon"], usage["nltk"]
+        )
+
+
+def lemmatize(token: str, pos: str) -> str:
+    """Lemmatize from the lexicon, falling back to WordNet on a miss."""
+    if _table is not None:
+        lemma = _table.get(lemma_key(token, pos))
+        if lemma is not None:
+            return lemma.decode("utf-8")
+
+    return _lemmatizer.lemmatize(token, pos)  # type: ignore
+
+
+def lemma_key(token: str, pos: str) -> bytes:
+    """Return the lexicon key of a lemma."""
+    return LEMMA_PREFIX + pos.encode("utf-8") + b"\0" + token.encode("utf-8")
+
+
+def corpus(infiles: List[str]) -> Iterator[List[str]]:
+    """Yield the token lists the normalizers will see."""
+    # Training data for the classifier in mine.py
+    for name in ["positive_tweets.json", "negative_tweets.json"]:
+        yield from twitter_samples.tokenized(name)
+
+    # Cleaned text of previously preprocessed Tweets
+    for infile in infiles:
+        for tweet in rowindex.RowIndex(infile).rows():
+            yield word_tokenize(tweet[16])
+
+
+def build_lexicon(infiles: List[str], outfile: str) -> None:
+    """Compile frequent tags and lemmas into a memory-mappable lexicon."""
+    logger = logging.getLogger("lexicon")
+
+    # How often each token got each tag in context
+    tags: Dict[str, Counter] = {}  # type: ignore
+    held_out: List[List[Tuple[str, str]]] = []
+    counter = 0
+
+    for tokens in corpus(infiles):
+        tagged = nltk_pos_tag(tokens)
+
+        # Every HOLDOUT-th post only measures the lexicon at first
+        if counter % HOLDOUT == HOLDOUT - 1:
+            held_out.append(tagged)
+        else:
+            for token, tag in tagged:
+                tags.setdefault(token, Counter())[tag] += 1
+
+        if not counter % DIVISION:
+            logger.info("Tagged %s posts", counter)
+        counter += 1
+
+    log_agreement(compile_tags(tags), held_out)
+
+    for tagged in held_out:
+        for token, tag in tagged:
+            tags.setdefault(token, Counter())[tag] += 1
+
+    compiled = compile_tags(tags)
+    entries = []
+    for token in tags:
+        if token in compiled:
+            entries.append((TAG_PREFIX + token.encode("utf-8"), compiled[token].encode("utf-8")))
+
+        # Lemmas are context-free, so compile every part of speech of
+        # every token seen, sparing WordNet's slow load when re-reading
+        for pos in ["n", "v", "a"]:
+            lemma = _lemmatizer.lemmatize(token, pos)
+            entries.append((lemma_key(token, pos), lemma.encode("utf-8")))
+
+    logger.info("Writing %s entries for %s tokens", len(entries), len(tags))
+    sstable.write_table(outfile, entries)
+
+
+def compile_tags(tags: Dict[str, Counter]) -> Dict[str, str]:  # type: ignore
+    """Return the tokens whose tag can be trusted out of context."""
+    compiled = {}
+    for token, counts in tags.items():
+        total = sum(counts.values())
+        tag, count = counts.most_common(1)[0]
+        if total >= MIN_COUNT and count / total >= TAG_AGREEMENT:
+            compiled[token] = tag
+    return compiled
+
+
+def log_agreement(compiled: Dict[str, str], held_out: List[List[Tuple[str, str]]]) -> None:
+    """Log how often the lexicon would have disagreed with NLTK on held-out posts."""
+    covered = differing = tokens = 0
+    for tagged in held_out:
+        if all(token in compiled for token, _ in tagged):
+            covered += 1
+            tokens += len(tagged)
+            differing += sum(compiled[token] != tag for token, tag in tagged)
+
+    logging.getLogger("lexicon").info(
+        "%s of %s held-out posts fully covered, %s of their %s tags differ from NLTK",
+        covered,
+        len(held_out),
+        differing,
+        tokens,
+    )
+
+
+def main() -> int:
+    """Execute standalone."""
+    arg_p = argparse.ArgumentParser()
+    arg_p.add_argument("outfile", help="output lexicon file")
+    arg_p.add_argument("infiles", nargs="*", help="preprocessed .CSV files to learn from")
+
+    args = arg_p.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO, format="[%(levelname)s | %(name)s] %(message)s",
+    )
+
+    nltk.download("punkt")
+    nltk.download("averaged_perceptron_tagger")
+    nltk.download("wordnet")
+    nltk.download("twitter_samples")
+
+    build_lexicon(args.infiles, args.outfile)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
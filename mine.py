@@ -8,27 +8,293 @@
 
 #import tensorflow
 import argparse
-import csv
 import json
 import logging
+import os
 import pickle
 import random
+import re
 import string
 import sys
-from typing import Dict, Iterator, List
+from typing import Dict, Iterator, List, Optional, Tuple
 
+import nltk  # type: ignore
 from nltk import NaiveBayesClassifier, classify, ngrams  # type: ignore
 from nltk.corpus import twitter_samples  # type: ignore
-from nltk.stem.wordnet import WordNetLemmatizer  # type: ignore
-from nltk.tag import pos_tag  # type: ignore
+
+import cache
+import lexicon
+import rowindex
+import spill
+import sstable
 
 MAX_TWEETS = -1
+FIRST_TWEET = 0
 DIVISION = 25
 SUBJECTIVITY_THRESHOLD = 0.30
+SAMPLE_STRATA = 10
+
+
+def mine_tweets(
+    infile: str,
+    tweetout: str,
+    gramout: str,
+    postingout: str = "",
+    topics: Optional[List[str]] = None,
+    sample: int = 0,
+    budget: int = 0,
+    classifier: Optional[NaiveBayesClassifier] = None,
+) -> None:
+    """Classify, prune, and atomize Tweets.
+
+    If postingout is given, an inverted index from each n-gram to the
+    infile rows of the Tweets containing it is written there as well.
+
+    If topics are given, the n-grams of the Tweets tagged with each
+    topic are also counted separately and written to topic_path(gramout).
+
+    If sample is positive, only that many rows are mined, drawn evenly
+    from SAMPLE_STRATA equal slices of the input's rows, for a quick
+    preview. The slices follow file position only, which says nothing
+    reliable about when a Tweet was posted. The population and sample sizes are
+    recorded in gram_scores[0] for analyze.py to estimate errors with.
+
+    If budget is positive, n-grams are counted (along with their
+    sentiments) in about that many megabytes, spilling sorted partial
+    counts to disk and merging them into aggregate_path(gramout)
+    instead of keeping every n-gram in gram_scores. The postings are
+    then sorted on disk within the same budget.
+
+    If classifier is not given, one is trained from scratch.
+    """
+    logger = logging.getLogger("miner")
+
+    if classifier is None:
+        classifier = train_classifier()
+
+    logger.info("Classifying Tweets")
+    tweets = []
+
+    # Seek straight to the first row we want
+    row_index = rowindex.RowIndex(infile)
+    logger.info("Indexed %s rows in %s, starting at row %s", len(row_index), infile, FIRST_TWEET)
+
+    # Rows we would read in an exact run
+    population = max(0, len(row_index) - FIRST_TWEET)
+    if MAX_TWEETS != -1:
+        population = min(population, MAX_TWEETS)
+
+    # Either every row, or a stratified sample of them
+    if 0 < sample < population:
+        logger.info("Sampling %s of %s rows", sample, population)
+        records = sample_rows(row_index, FIRST_TWEET, population, sample)
+    else:
+        records = enumerate(row_index.rows(FIRST_TWEET), FIRST_TWEET)
+
+    # Counts processed Tweets and rejected ones
+    counter: int = 0
+    subject_reject: int = 0
+
+    # Audited prefilter decisions, keyed by (dropped, rejected here)
+    audit: Dict[Tuple[bool, bool], int] = {}
+
+    # Iterate
+    for row, tweet in records:
+
+        # Printing
+        if not counter % DIVISION:
+            logger.info("Read in %s Tweets so far...", counter)
+
+        # For debugging
+        if counter == MAX_TWEETS:
+            break
+
+        # Classify Tweet
+        new_tweet = Tweet(tweet)
+        new_tweet.row = row
+        dist = classifier.prob_classify(
+            dict([token, True] for token in new_tweet.cleaned_tokens)  # type: ignore
+        )
+        new_tweet.positivity = dist.prob("Positive")
+        new_tweet.negativity = dist.prob("Negative")
+        new_tweet.difference = abs(new_tweet.positivity - new_tweet.negativity)
+
+        # Score the preprocess prefilter against the full classifier
+        if new_tweet.prefilter is not None:
+            outcome = (new_tweet.prefilter["drop"], new_tweet.difference <= SUBJECTIVITY_THRESHOLD)
+            audit[outcome] = audit.get(outcome, 0) + 1
+
+        # Assess the subjectivity of the Tweet
+        if new_tweet.difference > SUBJECTIVITY_THRESHOLD:
+            tweets.append(new_tweet)
+        else:
+            subject_reject += 1
+
+        # Count
+        counter += 1
+
+    logger.info("Processed %s Tweets", len(tweets))
+    lexicon.log_usage()
+    logger.info("%s Tweets were rejected for not being subjective enough", subject_reject)
+    if audit:
+        log_audit(audit)
+
+    # Pickle Tweets
+    pickle.dump(tweets, open(tweetout, "wb"))
+    logger.info("Pickled %s Tweets", len(tweets))
+
+    # Storing our n-gram occurrences
+    gram_scores: List[Dict[str, int]] = [{}, {}, {}, {}, {}]
+
+    # The unused 0-gram slot holds run metadata: the sampling design,
+    # if any, and whether the counts were aggregated on disk
+    if 0 < sample < population:
+        gram_scores[0] = {"population": population, "sample": counter}
+
+    # Per-topic n-gram occurrences, counted in the same pass
+    topic_scores: Dict[str, List[Dict[str, int]]] = {
+        topic: [{}, {}, {}, {}, {}] for topic in topics or []
+    }
+
+    # Exact totals spilled to disk under the memory budget, keyed by
+    # topic ("" being every Tweet)
+    aggregators: Dict[str, spill.SpillAggregator] = {}
+    directory = os.path.dirname(os.path.abspath(gramout))
+    # Rows of the Tweets each n-gram occurs in, ascending, or the
+    # same sorted on disk under the memory budget
+    postings: List[Dict[str, List[int]]] = [{}, {}, {}, {}, {}]
+    sorter: Optional[spill.SpillSorter] = None
+
+    if budget:
+        share = budget * 2 ** 20 // (1 + len(topic_scores) + bool(postingout))
+        for name in ["", *topic_scores]:
+            aggregators[name] = spill.SpillAggregator(share, directory)
+        if postingout:
+            sorter = spill.SpillSorter(share, directory)
+        gram_scores[0]["aggregate"] = True
+    sequence = 0
+
+    # Counting n-grams
+    for i in range(1, 5):
+        logger.info("Creating %s-grams", i)
+
+        # Iterate
+        for tweet in tweets:  # type: ignore
 
+            # Create n-grams
+            grams = ngrams(tweet.cleaned_tokens, i)  # type: ignore
+
+            # Count every gram
+            for gram in grams:
 
-def mine_tweets(infile: str, tweetout: str, gramout: str) -> None:
-    """Classify, prune, and atomize Tweets."""
+                # Count on disk when under a memory budget, keeping
+                # the order n-grams were first seen in for ties
+                if aggregators:
+                    key = json.dumps([i, *gram])
+                    positive = tweet.positivity > tweet.negativity
+                    for name in ["", *tweet.topics]:
+                        if name in aggregators:
+                            aggregators[name].add(key, positive, sequence)
+                    sequence += 1
+
+                # Create record for new n-gram
+                elif gram not in gram_scores[i]:
+                    gram_scores[i][gram] = 1
+
+                # Update existing record
+                else:
+                    gram_scores[i][gram] += 1
+
+                # Count towards every tracked topic of the Tweet
+                for topic in tweet.topics:
+                    if topic in topic_scores and not aggregators:
+                        scores = topic_scores[topic][i]
+                        scores[gram] = scores.get(gram, 0) + 1
+
+                # Post the Tweet once per n-gram
+                if sorter is not None:
+                    sorter.add(gram_key(i, gram).decode("utf-8"), tweet.row)
+                elif postingout:
+                    rows = postings[i].setdefault(gram, [])
+                    if not rows or rows[-1] != tweet.row:
+                        rows.append(tweet.row)
+
+    # Merge the spilled runs, marking the pickles as pointing to them
+    for name, aggregator in aggregators.items():
+        path = aggregate_path(topic_path(gramout, name) if name else gramout)
+        logger.info("Merging %s spilled runs into %s", len(aggregator.runs), path)
+        logger.info("Aggregated %s n-grams", spill.write_records(path, aggregator.merged()))
+
+    # Serialize n-grams to file
+    with open(gramout, "wb") as gramout_fp:
+        pickle.dump(gram_scores, gramout_fp)
+
+    # Serialize per-topic n-grams to their own files
+    for topic, scores in topic_scores.items():
+        scores[0] = gram_scores[0]
+        with open(topic_path(gramout, topic), "wb") as gramout_fp:
+            pickle.dump(scores, gramout_fp)
+        logger.info("Wrote %s 1-grams for topic '%s'", len(scores[1]), topic)
+
+    # Serialize the inverted index to file
+    if sorter is not None:
+        entries = sstable.write_table(
+            postingout,
+            (
+                (key.encode("utf-8"), sstable.pack_ids(rows))
+                for key, rows in sorter.merged()
+            ),
+            presorted=True,
+        )
+        logger.info("Indexed %s n-grams to %s", entries, postingout)
+    elif postingout:
+        entries = sstable.write_table(
+            postingout,
+            (
+                (gram_key(i, gram), sstable.pack_ids(rows))
+                for i in range(1, 5)
+                for gram, rows in postings[i].items()
+            ),
+        )
+        logger.info("Indexed %s n-grams to %s", entries, postingout)
+
+
+def mine_tweets_cached(
+    infile: str,
+    tweetout: str,
+    gramout: str,
+    postingout: str = "",
+    topics: Optional[List[str]] = None,
+    sample: int = 0,
+    budget: int = 0,
+) -> None:
+    """Mine Tweets, reusing cached output (or just the classifier) if nothing changed."""
+    cache.cached(
+        "mine",
+        lambda: mine_tweets(
+            infile, tweetout, gramout, postingout, topics, sample, budget, load_classifier()
+        ),
+        [infile] + ([lexicon.loaded_path()] if lexicon.loaded_path() else []),
+        output_paths(tweetout, gramout, postingout, topics, budget),
+        {
+            "MAX_TWEETS": MAX_TWEETS,
+            "FIRST_TWEET": FIRST_TWEET,
+            "SUBJECTIVITY_THRESHOLD": SUBJECTIVITY_THRESHOLD,
+            "SAMPLE_STRATA": SAMPLE_STRATA,
+            "postings": bool(postingout),
+            "topics": topics,
+            "sample": sample,
+            "budget": budget,
+            "nltk": nltk.__version__,
+            # analyze.py can only unpickle Tweets from an importable module
+            "Tweet": f"{Tweet.__module__}.{Tweet.__qualname__}",
+        },
+        [sys.modules[__name__], lexicon, rowindex, spill, sstable],
+    )
+
+
+def train_classifier() -> NaiveBayesClassifier:
+    """Train the sentiment classifier on NLTK's sample Tweets."""
     logger = logging.getLogger("miner")
 
     logger.info("Gathering and tokenizing positive tweets")
@@ -75,82 +341,48 @@ def mine_tweets(infile: str, tweetout: str, gramout: str) -> None:
 
     logger.info("Accuracy is: %s", classify.accuracy(classifier, test_data))
 
-    logger.info("Classifying Tweets")
-    tweets = []
+    return classifier
 
-    with open(infile, "r") as csv_file:
-        logger.info("Opened %s", infile)
 
-        csv_reader = csv.reader(csv_file, delimiter=",")
-        logger.info("Attached CSV reader to %s successfully", infile)
+def load_classifier() -> NaiveBayesClassifier:
+    """Return the trained classifier, training it only if it isn't cached."""
+    path = os.path.join(cache.CACHE_DIR, "classifier")
+    os.makedirs(cache.CACHE_DIR, exist_ok=True)
 
-        # Counts processed Tweets and rejected ones
-        counter: int = 0
-        subject_reject: int = 0
+    def train() -> None:
+        with open(path, "wb") as classifier_fp:
+            pickle.dump(train_classifier(), classifier_fp)
 
-        # Iterate
-        for tweet in csv_reader:
-
-            # Printing
-            if not counter % DIVISION:
-                logger.info("Read in %s Tweets so far...", counter)
-
-            # For debugging
-            if counter == MAX_TWEETS:
-                break
-
-            # Classify Tweet
-            new_tweet = Tweet(tweet)
-            dist = classifier.prob_classify(
-                dict([token, True] for token in new_tweet.cleaned_tokens)  # type: ignore
-            )
-            new_tweet.positivity = dist.prob("Positive")
-            new_tweet.negativity = dist.prob("Negative")
-            new_tweet.difference = abs(new_tweet.positivity - new_tweet.negativity)
-
-            # Assess the subjectivity of the Tweet
-            if new_tweet.difference > SUBJECTIVITY_THRESHOLD:
-                tweets.append(new_tweet)
-            else:
-                subject_reject += 1
-
-            # Count
-            counter += 1
+    cache.cached(
+        "classifier",
+        train,
+        [lexicon.loaded_path()] if lexicon.loaded_path() else [],
+        [path],
+        {"nltk": nltk.__version__},
+        [sys.modules[__name__], lexicon],
+    )
 
-    logger.info("Processed %s Tweets", len(tweets))
-    logger.info("%s Tweets were rejected for not being subjective enough", subject_reject)
+    with open(path, "rb") as classifier_fp:
+        return pickle.load(classifier_fp)
 
-    # Pickle Tweets
-    pickle.dump(tweets, open(tweetout, "wb"))
-    logger.info("Pickled %s Tweets", len(tweets))
 
-    # Storing our n-gram occurrences
-    gram_scores: List[Dict[str, int]] = [{}, {}, {}, {}, {}]
+def output_paths(
+    tweetout: str,
+    gramout: str,
+    postingout: str = "",
+    topics: Optional[List[str]] = None,
+    budget: int = 0,
+) -> List[str]:
+    """List every file mine_tweets writes for these arguments."""
+    grams = [gramout] + [topic_path(gramout, topic) for topic in topics or []]
+    paths = [tweetout] + grams
 
-    # Counting n-grams
-    for i in range(1, 5):
-        logger.info("Creating %s-grams", i)
+    if postingout:
+        paths.append(postingout)
+    if budget:
+        paths += [aggregate_path(path) for path in grams]
 
-        # Iterate
-        for tweet in tweets:  # type: ignore
-
-            # Create n-grams
-            grams = ngrams(tweet.cleaned_tokens, i)  # type: ignore
-
-            # Count every gram
-            for gram in grams:
-
-                # Create record for new n-gram
-                if gram not in gram_scores[i]:
-                    gram_scores[i][gram] = 1
-
-                # Update existing record
-                else:
-                    gram_scores[i][gram] += 1
-
-    # Serialize n-grams to file
-    with open(gramout, "wb") as gramout_fp:
-        pickle.dump(gram_scores, gramout_fp)
+    return paths
 
 
 class Tweet:
@@ -177,10 +409,72 @@ class Tweet:
         self.user_tweet_count = tweet_row[15]
         self.cleaned_text = tweet_row[16]
         self.cleaned_tokens = json.loads(tweet_row[17])
+        self.topics = json.loads(tweet_row[18]) if len(tweet_row) > 18 else []
+        self.prefilter = None
+        if len(tweet_row) > 19 and tweet_row[19]:
+            self.prefilter = json.loads(tweet_row[19])
 
         self.positivity = -1
         self.negativity = -1
         self.difference = -1
+        self.row = -1
+
+
+def log_audit(audit: Dict[Tuple[bool, bool], int]) -> None:
+    """Log the precision and recall of the preprocess prefilter's drops."""
+    logger = logging.getLogger("miner")
+    caught = audit.get((True, True), 0)
+    dropped = caught + audit.get((True, False), 0)
+    rejected = caught + audit.get((False, True), 0)
+
+    logger.info(
+        "Prefilter audit: %s of %s drops were rejected here too (precision %.3f)",
+        caught,
+        dropped,
+        caught / dropped if dropped else 1.0,
+    )
+    logger.info(
+        "Prefilter audit: %s of %s rejections were dropped early (recall %.3f)",
+        caught,
+        rejected,
+        caught / rejected if rejected else 1.0,
+    )
+    logger.info(
+        "Prefilter audit: %s subjective Tweets would have been lost",
+        audit.get((True, False), 0),
+    )
+
+
+def sample_rows(
+    row_index: rowindex.RowIndex, first: int, population: int, sample: int
+) -> Iterator[Tuple[int, List[str]]]:
+    """Yield a random sample of rows stratified by file position, seeking to each one."""
+    rows = []
+
+    # Proportional allocation across consecutive strata
+    for stratum in range(SAMPLE_STRATA):
+        start = first + population * stratum // SAMPLE_STRATA
+        stop = first + population * (stratum + 1) // SAMPLE_STRATA
+        want = sample * (stratum + 1) // SAMPLE_STRATA - sample * stratum // SAMPLE_STRATA
+        rows.extend(random.sample(range(start, stop), min(want, stop - start)))
+
+    for row in sorted(rows):
+        yield row, next(row_index.rows(row, row + 1))
+
+
+def aggregate_path(path: str) -> str:
+    """Return the path of the on-disk n-gram totals behind an n-gram pickle."""
+    return path + ".agg"
+
+
+def topic_path(path: str, topic: str) -> str:
+    """Return the per-topic variant of an output path."""
+    return f"{path}.{re.sub(r'[^a-z0-9]+', '_', topic.lower())}"
+
+
+def gram_key(size: int, gram: Tuple[str, ...]) -> bytes:
+    """Return the inverted index key of an n-gram."""
+    return f"{size} {' '.join(gram)}".encode("utf-8")
 
 
 def normalize(tweet_tokens: List[str]) -> List[str]:
@@ -188,7 +482,7 @@ def normalize(tweet_tokens: List[str]) -> List[str]:
     cleaned_tokens = []
 
     #  Part of Speech tagging
-    for token, tag in pos_tag(tweet_tokens):
+    for token, tag in lexicon.pos_tag(tweet_tokens):
 
         if tag.startswith("NN"):
             pos = "n"
@@ -198,8 +492,7 @@ def normalize(tweet_tokens: List[str]) -> List[str]:
             pos = "a"
 
         # Lemmatize
-        lemmatizer = WordNetLemmatizer()
-        token = lemmatizer.lemmatize(token, pos)
+        token = lexicon.lemmatize(token, pos)
 
         if len(token) > 0 and token not in string.punctuation:
             cleaned_tokens.append(token.lower())
@@ -226,6 +519,12 @@ def main() -> int:
     arg_p.add_argument("infile", help="input .CSV file")
     arg_p.add_argument("tweetout", help="output Tweets .CSV file")
     arg_p.add_argument("gramout", help="output n-grams .PICKLE file")
+    arg_p.add_argument("--postingout", default="", help="optional n-gram inverted index")
+    arg_p.add_argument("--lexicon", default="", help="optional lexicon from lexicon.py")
+    arg_p.add_argument("--topics", nargs="*", help="also count n-grams per tagged topic")
+    arg_p.add_argument("--sample", type=int, default=0, help="only mine this many sampled rows")
+    arg_p.add_argument("--budget", type=int, default=0, help="n-gram memory budget in MB")
+    arg_p.add_argument("--no-cache", action="store_true", help="always rerun, skipping the cache")
 
     args = arg_p.parse_args()
 
@@ -233,10 +532,23 @@ def main() -> int:
         level=logging.INFO, format="[%(levelname)s | %(name)s] %(message)s",
     )
 
-    mine_tweets(args.infile, args.tweetout, args.gramout)
+    lexicon.load(args.lexicon)
+    run = mine_tweets if args.no_cache else mine_tweets_cached
+    run(
+        args.infile,
+        args.tweetout,
+        args.gramout,
+        args.postingout,
+        args.topics,
+        args.sample,
+        args.budget,
+    )
 
     return 0
 
 
 if __name__ == "__main__":
-    sys.exit(main())
+    # Run as the importable module so Tweets pickle as mine.Tweet
+    import mine
+
+    sys.exit(mine.main())
@@ -9,35 +9,58 @@ import extract
 import preprocess
 import mine
 import analyze
+import lexicon
 
 def main() -> int:
     """Execute main."""
     arg_p = argparse.ArgumentParser()
     arg_p.add_argument("tokenfile", help="see README for details")
-    arg_p.add_argument("query", help="search term")
+    arg_p.add_argument("query", nargs="+", help="search term(s), each analyzed as its own topic")
     arg_p.add_argument("count", help="number of times to get 100 Tweets")
+    arg_p.add_argument("--lexicon", default="", help="optional lexicon from lexicon.py")
+    arg_p.add_argument("--sample", type=int, default=0, help="preview from this many sampled rows")
+    arg_p.add_argument("--budget", type=int, default=0, help="n-gram memory budget in MB")
+    arg_p.add_argument("--no-cache", action="store_true", help="always rerun every stage")
+    arg_p.add_argument(
+        "--prefilter", type=float, default=0.0, help="drop Tweets estimated at most this subjective"
+    )
+    arg_p.add_argument(
+        "--audit", action="store_true", help="report the prefilter's precision and recall"
+    )
 
     args = arg_p.parse_args()
 
+    if args.audit and args.prefilter <= 0:
+        arg_p.error("--audit needs a positive --prefilter")
+
     logging.basicConfig(
         level=logging.INFO, format="[%(levelname)s | %(name)s] %(message)s",
     )
 
+    lexicon.load(args.lexicon)
+
+    # Several queries share one extraction, model and pipeline pass
+    topics = args.query if len(args.query) > 1 else None
+
     print()
     logging.info("Initiating extraction module")
-    extract.extract_tweets(args.tokenfile, args.query, "_extract", count=int(args.count), wait=1)
+    extract.extract_tweets(
+        args.tokenfile, args.query[0], "_extract", count=int(args.count), wait=1, topics=topics
+    )
 
     print()
     logging.info("Initiating preprocessing module")
-    preprocess.preprocess_tweets("_extract", "_preprocess")
+    run = preprocess.preprocess_tweets if args.no_cache else preprocess.preprocess_tweets_cached
+    run("_extract", "_preprocess", args.prefilter, args.audit, topics)
 
     print()
     logging.info("Initiating mining module")
-    mine.mine_tweets("_preprocess", "_tweets", "_grams")
+    run = mine.mine_tweets if args.no_cache else mine.mine_tweets_cached
+    run("_preprocess", "_tweets", "_grams", "_postings", topics, args.sample, args.budget)
 
     print()
     logging.info("Initiating analysis module")
-    analyze.analyze_tweets("_tweets", "_grams", "_analysis")
+    analyze.analyze_tweets("_tweets", "_grams", "_analysis", topics)
 
     return 0
 
@@ -7,63 +7,114 @@ import argparse
 import csv
 import json
 import logging
+import math
 import re
 import string
 import sys
-from typing import List
+from typing import Dict, List, Optional
 
 import preprocessor  # type: ignore
 import nltk  # type: ignore
-from nltk.stem.wordnet import WordNetLemmatizer  # type: ignore
-from nltk.tag import pos_tag  # type: ignore
+from nltk.corpus import twitter_samples  # type: ignore
 from nltk.tokenize import word_tokenize  # type: ignore
 
+import cache
+import extract
+import lexicon
+import rowindex
+import sstable
+
 MAX_TWEETS = -1
+FIRST_TWEET = 0
 DIVISION = 25
 
 
-def preprocess_tweets(infile: str, outfile: str) -> None:
-    """Remove redundant and non-objective posts."""
+def preprocess_tweets(
+    infile: str,
+    outfile: str,
+    prefilter: float = 0.0,
+    audit: bool = False,
+    topics: Optional[List[str]] = None,
+) -> None:
+    """Remove redundant and non-objective posts.
+
+    If prefilter is positive, Tweets whose lexicon-based subjectivity
+    estimate (see estimate_subjectivity) is at most that are dropped
+    before the expensive tagging and lemmatization. With audit, nothing
+    is dropped; each row records its estimate and would-be decision so
+    mine.py can report the prefilter's precision and recall.
+
+    If topics are given, every Tweet is tagged with the ones it matches
+    now, so Tweets extracted before a topic was added count towards it.
+    """
     logger = logging.getLogger("preprocessor")
 
+    # Word polarities for the prefilter
+    polarities = polarity_lexicon() if prefilter else {}
+    prefiltered = 0
+
     # Number of Tweets read
     counter: int = 0
 
     # List of all Tweets
     tweets: List[Tweet] = []
 
-    # Begin reading
-    with open(infile, "r") as csv_file:
+    # Begin reading, seeking straight to the first row we want
+    row_index = rowindex.RowIndex(infile)
+    logger.info("Indexed %s rows, starting at row %s", len(row_index), FIRST_TWEET)
 
-        # CSV reader
-        csv_reader = csv.reader(csv_file, delimiter=",")
-        logger.info("Attached CSV reader")
+    # Number of Tweets deleted due to URL
+    url_blocked = 0
 
-        # Number of Tweets deleted due to URL
-        url_blocked = 0
+    # Iterate
+    for tweet in row_index.rows(FIRST_TWEET):
 
-        # Iterate
-        for tweet in csv_reader:
+        # Skip the header row the extracter writes
+        if tweet[3] == "id":
+            continue
 
-            # Messaging checkpoints
-            if not counter % DIVISION:
-                logger.info("Processed %s Tweets", counter)
+        # Messaging checkpoints
+        if not counter % DIVISION:
+            logger.info("Processed %s Tweets", counter)
 
-            # Break at limit
-            if counter == MAX_TWEETS:
-                break
+        # Break at limit
+        if counter == MAX_TWEETS:
+            break
 
-            # Only add Tweet if it doesn't contain a URL.
-            # As per Ejieh's master's thesis, the vast majority
-            # of posts with URLs lack any subjectivity.
-            ptn = r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+#]|[!*(),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+"
-            if not bool(re.search(ptn, tweet[0])):
-                tweets.append(Tweet(tweet))
-            else:
-                url_blocked += 1
+        # Only add Tweet if it doesn't contain a URL.
+        # As per Ejieh's master's thesis, the vast majority
+        # of posts with URLs lack any subjectivity.
+        ptn = r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+#]|[!*(),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+"
+        if bool(re.search(ptn, tweet[0])):
+            url_blocked += 1
             counter += 1
+            continue
+
+        # Cheaply drop clearly objective Tweets before tagging them
+        if prefilter:
+            score = estimate_subjectivity(Tweet.clean_tweet(tweet[0]), polarities)
+            if score <= prefilter:
+                prefiltered += 1
+                if not audit:
+                    counter += 1
+                    continue
+
+        new_tweet = Tweet(tweet)
+        if topics:
+            new_tweet.topics = json.dumps(extract.match_topics(new_tweet.full_text, topics))
+        if prefilter and audit:
+            new_tweet.prefilter = json.dumps({"score": score, "drop": score <= prefilter})
+        tweets.append(new_tweet)
+        counter += 1
 
     logger.info("Read %s Tweets in total", counter)
+    lexicon.log_usage()
+    if prefilter:
+        logger.info(
+            "%s Tweets %s by the subjectivity prefilter",
+            prefiltered,
+            "would have been dropped" if audit else "were dropped",
+        )
 
     # Finishing message
     logger.info("Only %s Tweets were kept", len(tweets))
@@ -92,6 +143,8 @@ def preprocess_tweets(infile: str, outfile: str) -> None:
                     tweet.user_tweet_count,  # type: ignore
                     tweet.cleaned_text,  # type: ignore
                     json.dumps(tweet.cleaned_tokens),  # type: ignore
+                    tweet.topics,  # type: ignore
+                    tweet.prefilter,  # type: ignore
                 ]
             )
 
@@ -101,6 +154,58 @@ def preprocess_tweets(infile: str, outfile: str) -> None:
     logger.info("Wrote %s Tweets in total", len(tweets))
 
 
+def preprocess_tweets_cached(
+    infile: str,
+    outfile: str,
+    prefilter: float = 0.0,
+    audit: bool = False,
+    topics: Optional[List[str]] = None,
+) -> None:
+    """Preprocess Tweets, reusing cached output if nothing changed."""
+    cache.cached(
+        "preprocess",
+        lambda: preprocess_tweets(infile, outfile, prefilter, audit, topics),
+        [infile] + ([lexicon.loaded_path()] if lexicon.loaded_path() else []),
+        [outfile],
+        {
+            "MAX_TWEETS": MAX_TWEETS,
+            "FIRST_TWEET": FIRST_TWEET,
+            "prefilter": prefilter,
+            "audit": audit,
+            "topics": topics,
+            "nltk": nltk.__version__,
+        },
+        [sys.modules[__name__], extract, lexicon, rowindex, sstable],
+    )
+
+
+def polarity_lexicon() -> Dict[str, float]:
+    """Return each word's positive-vs-negative log odds in the samples.
+
+    These are the classifier's training Tweets from mine.py, so the odds
+    approximate its Naive Bayes model without any tagging or lemmatizing.
+    """
+    counts: Dict[str, List[int]] = {}
+
+    for label, name in enumerate(["positive_tweets.json", "negative_tweets.json"]):
+        for tokens in twitter_samples.tokenized(name):
+            for token in set(token.lower() for token in tokens):
+                counts.setdefault(token, [0, 0])[label] += 1
+
+    # Add-one smoothing; words seen once say more about the sample than the class
+    return {
+        token: math.log((positive + 1) / (negative + 1))
+        for token, (positive, negative) in counts.items()
+        if positive + negative >= 2
+    }
+
+
+def estimate_subjectivity(cleaned_text: str, polarities: Dict[str, float]) -> float:
+    """Estimate mine.py's |positivity - negativity| from raw cleaned text."""
+    log_odds = sum(polarities.get(token, 0.0) for token in set(cleaned_text.lower().split()))
+    return abs(math.tanh(log_odds / 2))
+
+
 class Tweet:
     """Tweet object."""
 
@@ -124,6 +229,12 @@ class Tweet:
         self.user_verified = tweet_row[14]
         self.user_tweet_count = tweet_row[15]
 
+        # Topics tagged by a multi-topic extraction, if any
+        self.topics = tweet_row[16] if len(tweet_row) > 16 else "[]"
+
+        # Prefilter estimate and decision, only recorded when auditing
+        self.prefilter = ""
+
         # New members
         self.cleaned_text = Tweet.clean_tweet(self.full_text)
         self.cleaned_tokens = Tweet.normalize(word_tokenize(self.cleaned_text))
@@ -148,7 +259,7 @@ class Tweet:
         cleaned_tokens = []
 
         #  Part of Speech tagging
-        for token, tag in pos_tag(tweet_tokens):
+        for token, tag in lexicon.pos_tag(tweet_tokens):
 
             if tag.startswith("NN"):
                 pos = "n"
@@ -158,8 +269,7 @@ class Tweet:
                 pos = "a"
 
             # Lemmatize
-            lemmatizer = WordNetLemmatizer()
-            token = lemmatizer.lemmatize(token, pos)
+            token = lexicon.lemmatize(token, pos)
 
             if len(token) > 0 and token not in string.punctuation:
                 cleaned_tokens.append(token.lower())
@@ -172,9 +282,21 @@ def main() -> int:
     arg_p = argparse.ArgumentParser()
     arg_p.add_argument("infile", help="input .CSV file")
     arg_p.add_argument("outfile", help="output .CSV file")
+    arg_p.add_argument("--lexicon", default="", help="optional lexicon from lexicon.py")
+    arg_p.add_argument("--no-cache", action="store_true", help="always rerun, skipping the cache")
+    arg_p.add_argument(
+        "--prefilter", type=float, default=0.0, help="drop Tweets estimated at most this subjective"
+    )
+    arg_p.add_argument(
+        "--audit", action="store_true", help="keep prefiltered Tweets for mine.py to score"
+    )
+    arg_p.add_argument("--topics", nargs="*", help="tag Tweets with the topics they match")
 
     args = arg_p.parse_args()
 
+    if args.audit and args.prefilter <= 0:
+        arg_p.error("--audit needs a positive --prefilter")
+
     logging.basicConfig(
         level=logging.INFO, format="[%(levelname)s | %(name)s] %(message)s",
     )
@@ -185,7 +307,9 @@ def main() -> int:
     nltk.download("twitter_samples")
     nltk.download("stopwords")
 
-    preprocess_tweets(args.infile, args.outfile)
+    lexicon.load(args.lexicon)
+    run = preprocess_tweets if args.no_cache else preprocess_tweets_cached
+    run(args.infile, args.outfile, args.prefilter, args.audit, args.topics)
 
     return 0
 
@@ -0,0 +1,257 @@
+"""Row index module."""
+
+import argparse
+import bisect
+import csv
+import io
+import logging
+import os
+import re
+import struct
+import sys
+import zlib
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+# Header: magic, bytes of the CSV covered by the index, number of
+# offsets covered, and a CRC of the bytes just before that point (to
+# notice a rewritten CSV). Offsets past the row count were appended by
+# an interrupted scan and are cut off before the index is used.
+MAGIC = b"PLUMROW2"
+HEADER = struct.Struct("<8sQQI4x")
+OFFSET = struct.Struct("<Q")
+TAIL = 64
+CHUNK = 1 << 20
+
+
+def index_path(path: str) -> str:
+    """Return the path of the row index kept beside a CSV file."""
+    return path + ".rows"
+
+
+class RowIndex:
+    """Sidecar index of the byte offset at which each CSV record starts.
+
+    If the sidecar can't be written (say, next to a read-only input), the
+    offsets are kept in memory instead for as long as the object lives.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Open the index for a CSV file, building or extending it as needed."""
+        self.path = path
+        self.index = index_path(path)
+        self.offsets: Optional[List[int]] = None
+        self.end = 0
+        self.refresh()
+
+    def __len__(self) -> int:
+        """Return the number of complete records in O(1)."""
+        if self.offsets is not None:
+            return len(self.offsets)
+        with open(self.index, "rb") as index_fp:
+            return HEADER.unpack(index_fp.read(HEADER.size))[2]  # type: ignore
+
+    def refresh(self) -> None:
+        """Index any records appended since the last refresh."""
+        logger = logging.getLogger("rowindex")
+        size = os.path.getsize(self.path)
+
+        if self.offsets is None:
+            try:
+                indexed = self._indexed()
+                if indexed is None:
+                    logger.info("Building row index for %s", self.path)
+                    with open(self.index, "wb") as index_fp:
+                        index_fp.write(HEADER.pack(MAGIC, 0, 0, 0))
+                    indexed = 0
+
+                if size > indexed:
+                    self._append(*self._scan(indexed))
+                return
+            except OSError as error:
+                logger.warning("Can't write %s (%s), indexing in memory", self.index, error)
+                self.offsets = []
+
+        if size > self.end:
+            offsets, self.end = self._scan(self.end)
+            self.offsets.extend(offsets)
+
+    def offset(self, row: int) -> int:
+        """Return the byte offset of record number row."""
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        if self.offsets is not None:
+            return self.offsets[row]
+        with open(self.index, "rb") as index_fp:
+            index_fp.seek(HEADER.size + row * OFFSET.size)
+            return OFFSET.unpack(index_fp.read(OFFSET.size))[0]  # type: ignore
+
+    def rows(self, start: int = 0, stop: Optional[int] = None) -> Iterator[List[str]]:
+        """Yield parsed records from row start up to (not including) stop.
+
+        Without a stop, reading carries on to the end of the file, so a
+        last record with no trailing newline (never indexed) is included.
+        """
+        rows = len(self)
+        end = rows if stop is None else min(stop, rows)
+        if start > end or (start == end and stop is not None):
+            return
+        with open(self.path, "rb") as raw_fp:
+            # Past the last indexed record is the unindexed tail
+            raw_fp.seek(self.offset(start) if start < rows else self._indexed() or 0)
+            text_fp = io.TextIOWrapper(raw_fp, encoding="utf-8", newline="")
+            for row, record in enumerate(csv.reader(text_fp, delimiter=","), start):
+                if row == end and stop is not None:
+                    break
+                yield record
+
+    def split(self, parts: int) -> List[Tuple[int, int]]:
+        """Split the indexed bytes into record-aligned ranges of similar size."""
+        total = self._indexed() or 0
+        rows = len(self)
+        ranges = []
+        begin = 0
+
+        for part in range(1, parts + 1):
+            # First record starting at or after the ideal cut
+            row = bisect.bisect_left(_Offsets(self), total * part // parts, 0, rows)
+            end = self.offset(row) if row < rows else total
+            if end > begin:
+                ranges.append((begin, end))
+                begin = end
+
+        return ranges
+
+    def _indexed(self) -> Optional[int]:
+        """Return the bytes covered by a still-valid index, or None."""
+        if self.offsets is not None:
+            return self.end
+        if not os.path.exists(self.index):
+            return None
+
+        with open(self.index, "rb") as index_fp:
+            header = index_fp.read(HEADER.size)
+        if len(header) != HEADER.size:
+            return None
+
+        magic, indexed, rows, crc = HEADER.unpack(header)
+        if magic != MAGIC or indexed > os.path.getsize(self.path):
+            return None
+        if _tail_crc(self.path, indexed) != crc:
+            return None
+
+        # Drop offsets left behind by a scan that never updated the header
+        end = HEADER.size + rows * OFFSET.size
+        if os.path.getsize(self.index) < end:
+            return None
+        if os.path.getsize(self.index) > end:
+            os.truncate(self.index, end)
+
+        return indexed  # type: ignore
+
+    def _scan(self, start: int) -> Tuple[List[int], int]:
+        """Return the offsets of complete records found after start, and their end."""
+        offsets = []
+        quoted = False
+        record = start
+        pos = start
+
+        with open(self.path, "rb") as csv_fp:
+            csv_fp.seek(start)
+            while True:
+                chunk = csv_fp.read(CHUNK)
+                if not chunk:
+                    break
+
+                # Quotes toggle the state ("" toggles twice), and only
+                # newlines outside quotes end a record
+                for match in re.finditer(b'["\n]', chunk):
+                    if match.group() == b'"':
+                        quoted = not quoted
+                    elif not quoted:
+                        offsets.append(record)
+                        record = pos + match.end()
+                pos += len(chunk)
+
+        # A trailing partial record is picked up by a later refresh
+        return offsets, record
+
+    def _append(self, offsets: List[int], record: int) -> None:
+        """Add scanned offsets to the sidecar, covering bytes up to record."""
+        # The offsets must be on disk before the header counts them
+        rows = len(self)
+        with open(self.index, "r+b") as index_fp:
+            index_fp.seek(HEADER.size + rows * OFFSET.size)
+            for offset in offsets:
+                index_fp.write(OFFSET.pack(offset))
+            index_fp.flush()
+            os.fsync(index_fp.fileno())
+            index_fp.seek(0)
+            index_fp.write(
+                HEADER.pack(MAGIC, record, rows + len(offsets), _tail_crc(self.path, record))
+            )
+
+
+class _Offsets:
+    """Sequence view of the on-disk offsets for bisect."""
+
+    def __init__(self, row_index: RowIndex) -> None:
+        """Wrap a RowIndex."""
+        self.row_index = row_index
+
+    def __getitem__(self, row: int) -> int:
+        """Return the offset of a record."""
+        return self.row_index.offset(row)
+
+    def __len__(self) -> int:
+        """Return the number of records."""
+        return len(self.row_index)
+
+
+def _tail_crc(path: str, end: int) -> int:
+    """Return the CRC of the bytes just before end."""
+    with open(path, "rb") as csv_fp:
+        csv_fp.seek(max(0, end - TAIL))
+        return zlib.crc32(csv_fp.read(end - max(0, end - TAIL)))
+
+
+def read_range(path: str, start: int, end: int) -> Iterator[List[str]]:
+    """Yield the records in a byte range from RowIndex.split."""
+    if end <= start:
+        return
+    with open(path, "rb") as csv_fp:
+        csv_fp.seek(start)
+        yield from csv.reader(_lines(csv_fp, end), delimiter=",")
+
+
+def _lines(csv_fp: BinaryIO, end: int) -> Iterator[str]:
+    """Yield decoded lines from the current position up to end."""
+    while csv_fp.tell() < end:
+        line = csv_fp.readline(end - csv_fp.tell())
+        if not line:
+            break
+        yield line.decode("utf-8")
+
+
+def main() -> int:
+    """Execute standalone."""
+    arg_p = argparse.ArgumentParser()
+    arg_p.add_argument("infile", help="input .CSV file")
+    arg_p.add_argument("--parts", type=int, default=0, help="print balanced byte ranges")
+
+    args = arg_p.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO, format="[%(levelname)s | %(name)s] %(message)s",
+    )
+
+    row_index = RowIndex(args.infile)
+    logging.getLogger("rowindex").info("%s has %s rows", args.infile, len(row_index))
+
+    for start, end in row_index.split(args.parts) if args.parts else []:
+        print(start, end)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""Spill-to-disk aggregation module."""
+
+import heapq
+import os
+import tempfile
+from typing import Dict, IO, Iterator, List, Optional, Tuple
+
+# Rough bytes a dict entry and its record take beyond the key itself
+ENTRY_OVERHEAD = 200
+
+# Runs merged at once before they are compacted into one
+MAX_RUNS = 64
+
+Record = Tuple[str, int, int, int, int]
+
+
+class SpillAggregator:
+    """Exact (count, positive, negative, first seen) totals per key.
+
+    Totals are kept in a dict until it outgrows the memory budget, at
+    which point they are written out as a sorted run file. merged()
+    streams the final totals in key order by merging every run.
+    """
+
+    def __init__(self, budget: int, directory: Optional[str] = None) -> None:
+        """Create an aggregator that holds about budget bytes in memory."""
+        self.budget = budget
+        self.directory = directory
+        self.totals: Dict[str, List[int]] = {}
+        self.used = 0
+        self.runs: List[str] = []
+
+    def add(self, key: str, positive: bool, first: int) -> None:
+        """Count one occurrence of a key (keys may not contain tabs or newlines)."""
+        record = self.totals.get(key)
+
+        if record is None:
+            self.totals[key] = [1, int(positive), int(not positive), first]
+            self.used += len(key) + ENTRY_OVERHEAD
+            if self.used > self.budget:
+                self.spill()
+            return
+
+        record[0] += 1
+        record[1 if positive else 2] += 1
+
+    def spill(self) -> None:
+        """Write the in-memory totals out as a sorted run."""
+        if not self.totals:
+            return
+
+        handle, path = tempfile.mkstemp(prefix="plumage-", suffix=".run", dir=self.directory)
+        with os.fdopen(handle, "w", encoding="utf-8") as run_fp:
+            for key in sorted(self.totals):
+                run_fp.write(_format((key, *self.totals[key])))  # type: ignore
+
+        self.runs.append(path)
+        self.totals = {}
+        self.used = 0
+
+        if len(self.runs) >= MAX_RUNS:
+            self._compact()
+
+    def merged(self) -> Iterator[Record]:
+        """Yield the exact totals of every key in key order, then clean up."""
+        in_memory = ((key, *self.totals[key]) for key in sorted(self.totals))
+        run_fps = [open(path, "r", encoding="utf-8") for path in self.runs]
+
+        try:
+            yield from _merge([_parse(run_fp) for run_fp in run_fps] + [in_memory])  # type: ignore
+        finally:
+            for run_fp in run_fps:
+                run_fp.close()
+            for path in self.runs:
+                os.remove(path)
+            self.runs = []
+            self.totals = {}
+            self.used = 0
+
+    def _compact(self) -> None:
+        """Merge every run into one so merged() never opens too many files."""
+        handle, path = tempfile.mkstemp(prefix="plumage-", suffix=".run", dir=self.directory)
+        run_fps = [open(run, "r", encoding="utf-8") for run in self.runs]
+
+        with os.fdopen(handle, "w", encoding="utf-8") as out_fp:
+            for record in _merge([_parse(run_fp) for run_fp in run_fps]):
+                out_fp.write(_format(record))
+
+        for run_fp in run_fps:
+            run_fp.close()
+        for run in self.runs:
+            os.remove(run)
+        self.runs = [path]
+
+
+class SpillSorter:
+    """External sort of (key, row) pairs, grouped into ascending row lists.
+
+    Pairs are kept in a list until it outgrows the memory budget, at
+    which point they are written out as a sorted run file. merged()
+    streams each key with its distinct rows in key order.
+    """
+
+    def __init__(self, budget: int, directory: Optional[str] = None) -> None:
+        """Create a sorter that holds about budget bytes in memory."""
+        self.budget = budget
+        self.directory = directory
+        self.pairs: List[Tuple[str, int]] = []
+        self.used = 0
+        self.runs: List[str] = []
+
+    def add(self, key: str, row: int) -> None:
+        """Add one pair (keys may not contain tabs or newlines)."""
+        self.pairs.append((key, row))
+        self.used += len(key) + ENTRY_OVERHEAD
+        if self.used > self.budget:
+            self.spill()
+
+    def spill(self) -> None:
+        """Write the in-memory pairs out as a sorted run."""
+        if not self.pairs:
+            return
+
+        handle, path = tempfile.mkstemp(prefix="plumage-", suffix=".run", dir=self.directory)
+        with os.fdopen(handle, "w", encoding="utf-8") as run_fp:
+            for key, row in sorted(self.pairs):
+                run_fp.write(f"{key}\t{row}\n")
+
+        self.runs.append(path)
+        self.pairs = []
+        self.used = 0
+
+        if len(self.runs) >= MAX_RUNS:
+            self._compact()
+
+    def merged(self) -> Iterator[Tuple[str, List[int]]]:
+        """Yield every key with its ascending, distinct rows, then clean up."""
+        run_fps = [open(path, "r", encoding="utf-8") for path in self.runs]
+        streams = [_parse_pairs(run_fp) for run_fp in run_fps] + [iter(sorted(self.pairs))]
+        current: Optional[Tuple[str, List[int]]] = None
+
+        try:
+            for key, row in heapq.merge(*streams):  # type: ignore
+                if current is not None and current[0] == key:
+                    if current[1][-1] != row:
+                        current[1].append(row)
+                    continue
+                if current is not None:
+                    yield current
+                current = (key, [row])
+            if current is not None:
+                yield current
+        finally:
+            for run_fp in run_fps:
+                run_fp.close()
+            for path in self.runs:
+                os.remove(path)
+            self.runs = []
+            self.pairs = []
+            self.used = 0
+
+    def _compact(self) -> None:
+        """Merge every run into one so merged() never opens too many files."""
+        handle, path = tempfile.mkstemp(prefix="plumage-", suffix=".run", dir=self.directory)
+        run_fps = [open(run, "r", encoding="utf-8") for run in self.runs]
+
+        with os.fdopen(handle, "w", encoding="utf-8") as out_fp:
+            for key, row in heapq.merge(*[_parse_pairs(run_fp) for run_fp in run_fps]):
+                out_fp.write(f"{key}\t{row}\n")
+
+        for run_fp in run_fps:
+            run_fp.close()
+        for run in self.runs:
+            os.remove(run)
+        self.runs = [path]
+
+
+def write_records(path: str, records: Iterator[Record]) -> int:
+    """Write merged totals to a file, returning how many there were."""
+    written = 0
+    with open(path, "w", encoding="utf-8") as out_fp:
+        for record in records:
+            out_fp.write(_format(record))
+            written += 1
+    return written
+
+
+def read_records(path: str) -> Iterator[Record]:
+    """Stream totals written by write_records."""
+    with open(path, "r", encoding="utf-8") as in_fp:
+        yield from _parse(in_fp)
+
+
+def _merge(streams: List[Iterator[Record]]) -> Iterator[Record]:
+    """Merge key-ordered streams, combining the totals of equal keys."""
+    current: Optional[List] = None  # type: ignore
+
+    for key, count, positive, negative, first in heapq.merge(*streams):
+        if current is not None and current[0] == key:
+            current[1] += count
+            current[2] += positive
+            current[3] += negative
+            current[4] = min(current[4], first)
+            continue
+        if current is not None:
+            yield tuple(current)  # type: ignore
+        current = [key, count, positive, negative, first]
+
+    if current is not None:
+        yield tuple(current)  # type: ignore
+
+
+def _parse_pairs(lines: IO[str]) -> Iterator[Tuple[str, int]]:
+    """Parse tab-separated (key, row) pairs."""
+    for line in lines:
+        key, row = line.rstrip("\n").split("\t")
+        yield key, int(row)
+
+
+def _format(record: Record) -> str:
+    """Serialize a record as a tab-separated line."""
+    return "\t".join(str(field) for field in record) + "\n"
+
+
+def _parse(lines: IO[str]) -> Iterator[Record]:
+    """Parse tab-separated records."""
+    for line in lines:
+        key, count, positive, negative, first = line.rstrip("\n").split("\t")
+        yield key, int(count), int(positive), int(negative), int(first)
@@ -0,0 +1,139 @@
+"""Sorted table module."""
+
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from typing import Iterable, List, Optional, Tuple
+
+# Header: magic and number of entries, followed by the key and value
+# offset arrays (one extra entry each marking the end), then the blobs
+MAGIC = b"PLUMSST1"
+HEADER = struct.Struct("<8sQ")
+OFFSET = struct.Struct("<Q")
+
+
+def write_table(
+    path: str, items: Iterable[Tuple[bytes, bytes]], presorted: bool = False
+) -> int:
+    """Write key/value pairs as an immutable table sorted by key.
+
+    If the items already come in key order (and without duplicate keys),
+    pass presorted to stream them to disk instead of sorting in memory.
+    """
+    entries = iter(items) if presorted else iter(sorted(items))
+    count = 0
+
+    # The offset arrays precede the blobs, so all four sections are
+    # staged in temporary files and concatenated once the count is known
+    directory = os.path.dirname(os.path.abspath(path))
+    sections = [tempfile.TemporaryFile(dir=directory) for _ in range(4)]
+    key_offsets, value_offsets, keys, values = sections
+    try:
+        key_offsets.write(OFFSET.pack(0))
+        value_offsets.write(OFFSET.pack(0))
+        for key, value in entries:
+            keys.write(key)
+            values.write(value)
+            key_offsets.write(OFFSET.pack(keys.tell()))
+            value_offsets.write(OFFSET.pack(values.tell()))
+            count += 1
+
+        with open(path, "wb") as table_fp:
+            table_fp.write(HEADER.pack(MAGIC, count))
+            for section in sections:
+                section.seek(0)
+                shutil.copyfileobj(section, table_fp)
+    finally:
+        for section in sections:
+            section.close()
+
+    return count
+
+
+class Table:
+    """Memory-mapped, read-only view of a table written by write_table."""
+
+    def __init__(self, path: str) -> None:
+        """Map a table file."""
+        self.path = path
+        with open(path, "rb") as table_fp:
+            self.data = mmap.mmap(table_fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.entries = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a table")
+
+        self.key_offsets = HEADER.size
+        self.value_offsets = self.key_offsets + (self.entries + 1) * OFFSET.size
+        self.keys = self.value_offsets + (self.entries + 1) * OFFSET.size
+        self.values = self.keys + self._offset(self.key_offsets, self.entries)
+
+    def __len__(self) -> int:
+        """Return the number of entries."""
+        return self.entries  # type: ignore
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        """Binary search for a key, returning its value or None."""
+        low, high = 0, self.entries
+        while low < high:
+            mid = (low + high) // 2
+            if self._key(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+
+        if low < self.entries and self._key(low) == key:
+            start = self._offset(self.value_offsets, low)
+            end = self._offset(self.value_offsets, low + 1)
+            return self.data[self.values + start : self.values + end]
+
+        return None
+
+    def close(self) -> None:
+        """Unmap the table."""
+        self.data.close()
+
+    def _offset(self, array: int, entry: int) -> int:
+        """Read one entry of an offset array."""
+        return OFFSET.unpack_from(self.data, array + entry * OFFSET.size)[0]  # type: ignore
+
+    def _key(self, entry: int) -> bytes:
+        """Read one key."""
+        start = self._offset(self.key_offsets, entry)
+        end = self._offset(self.key_offsets, entry + 1)
+        return self.data[self.keys + start : self.keys + end]
+
+
+def pack_ids(ids: List[int]) -> bytes:
+    """Delta- and varint-encode an ascending list of ids."""
+    packed = bytearray()
+    last = 0
+
+    for value in ids:
+        delta = value - last
+        last = value
+        while delta >= 0x80:
+            packed.append((delta & 0x7F) | 0x80)
+            delta >>= 7
+        packed.append(delta)
+
+    return bytes(packed)
+
+
+def unpack_ids(packed: bytes) -> List[int]:
+    """Decode ids encoded by pack_ids."""
+    ids = []
+    last = delta = shift = 0
+
+    for byte in packed:
+        delta |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        last += delta
+        ids.append(last)
+        delta = shift = 0
+
+    return ids
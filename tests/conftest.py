@@ -0,0 +1,66 @@
+"""Shared fixtures.
+
+The pipeline modules sit at the top of the repository, and the NLTK
+models and corpora they use are replaced by small stand-ins so the
+tests run without any downloaded data.
+"""
+
+import os
+import random
+import sys
+
+import pytest  # type: ignore
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=C0413
+import analyze  # noqa: E402
+import lexicon  # noqa: E402
+import mine  # noqa: E402
+import preprocess  # noqa: E402
+
+WORDS = "good bad happy sad great awful stay home mask vaccine people love hate day".split()
+
+
+class FakeSamples:
+    """Stand-in for nltk.corpus.twitter_samples."""
+
+    def tokenized(self, name):  # type: ignore
+        """Return reproducible posts leaning positive or negative."""
+        rnd = random.Random(name)
+        lean = WORDS[:3] if "positive" in name else WORDS[3:6]
+        return [[rnd.choice(lean)] + rnd.sample(WORDS, 4) for _ in range(500)]
+
+
+class FakeLemmatizer:
+    """Stand-in for WordNetLemmatizer."""
+
+    def lemmatize(self, token, pos="n"):  # type: ignore
+        """Strip a plural s."""
+        return token[:-1] if token.endswith("s") and len(token) > 3 else token
+
+
+class FakeStopwords:
+    """Stand-in for nltk.corpus.stopwords."""
+
+    def words(self, language):  # type: ignore
+        """Return a few English stop words."""
+        return ["the", "a", "and"]
+
+
+@pytest.fixture
+def fake_nltk(monkeypatch):  # type: ignore
+    """Replace the data-backed NLTK pieces of every pipeline stage."""
+    monkeypatch.setattr(
+        lexicon, "nltk_pos_tag", lambda tokens: [(t, "NN" if len(t) > 4 else "VB") for t in tokens]
+    )
+    monkeypatch.setattr(lexicon, "_lemmatizer", FakeLemmatizer())
+    monkeypatch.setattr(preprocess, "word_tokenize", str.split)
+    for module in [lexicon, mine, preprocess]:
+        monkeypatch.setattr(module, "twitter_samples", FakeSamples())
+    monkeypatch.setattr(analyze, "stopwords", FakeStopwords())
+
+
+def extract_row(tweet_id: int, text: str) -> list:  # type: ignore
+    """Return an extracter row without its optional topics column."""
+    return [text, "2020", "web", str(tweet_id), 0, 0, "u", "1", "h", "", "", False, 1, "", False, 5]
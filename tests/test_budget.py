@@ -0,0 +1,80 @@
+"""Tests for n-gram aggregation under a memory budget."""
+
+import csv
+import logging
+import random
+
+import analyze
+import mine
+import preprocess
+import spill
+import sstable
+from conftest import WORDS, extract_row
+
+
+def run_pipeline(tmp_path, name, classifier, budget):  # type: ignore
+    """Mine and analyze the preprocessed Tweets into files named after name."""
+    paths = {part: str(tmp_path / f"{name}_{part}") for part in ["tweets", "grams", "postings"]}
+    mine.mine_tweets(
+        str(tmp_path / "preprocess.csv"),
+        paths["tweets"],
+        paths["grams"],
+        paths["postings"],
+        budget=budget,
+        classifier=classifier,
+    )
+    analyze.analyze_tweets(paths["tweets"], paths["grams"], str(tmp_path / f"{name}.csv"))
+
+
+def test_budget_matches_in_memory(tmp_path, fake_nltk, monkeypatch, caplog):  # type: ignore
+    """Spilled runs give the same report, export, and postings as counting in memory."""
+    rnd = random.Random(0)
+    with open(tmp_path / "extract.csv", "w", encoding="utf-8") as extract_fp:
+        writer = csv.writer(extract_fp)
+        for i in range(300):
+            writer.writerow(extract_row(100 + i, " ".join(rnd.choice(WORDS) for _ in range(8))))
+    preprocess.preprocess_tweets(str(tmp_path / "extract.csv"), str(tmp_path / "preprocess.csv"))
+    classifier = mine.train_classifier()
+
+    # Spill every few entries, checking that it happened
+    spills = []
+    original = spill.SpillAggregator.spill
+
+    def counting_spill(self):  # type: ignore
+        spills.append(len(self.totals))
+        original(self)
+
+    monkeypatch.setattr(spill, "ENTRY_OVERHEAD", 20000)
+    monkeypatch.setattr(spill.SpillAggregator, "spill", counting_spill)
+
+    reports = []
+    for name, budget in [("memory", 0), ("budget", 1)]:
+        caplog.clear()
+        with caplog.at_level(logging.INFO, logger="analyzer"):
+            run_pipeline(tmp_path, name, classifier, budget)
+        reports.append([line for line in caplog.messages if line.startswith("|")])
+
+    assert spills
+    assert not list(tmp_path.glob("plumage-*.run"))
+    assert reports[0] == reports[1]
+    assert len(reports[0]) > 3 * analyze.REPORT_LIMIT
+
+    with open(tmp_path / "memory.csv", encoding="utf-8") as memory_fp:
+        with open(tmp_path / "budget.csv", encoding="utf-8") as budget_fp:
+            assert memory_fp.read() == budget_fp.read()
+
+    memory = sstable.Table(str(tmp_path / "memory_postings"))
+    budgeted = sstable.Table(str(tmp_path / "budget_postings"))
+    assert len(memory) == len(budgeted)
+    for entry in range(len(memory)):
+        key = memory._key(entry)  # pylint: disable=W0212
+        assert budgeted.get(key) == memory.get(key)
+
+
+def test_preview_interval_counts_positive_tweets():  # type: ignore
+    aspect = analyze.Aspect(("good",), 4)
+    aspect.positive, aspect.negative = 3, 1
+    aspect.tweets, aspect.positive_tweets, aspect.squares = 2, 1, 10
+
+    _, _, low, high = analyze.estimate_columns(aspect, {"sample": 2, "population": 20})
+    assert (low, high) == analyze.wilson_interval(1, 2)
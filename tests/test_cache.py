@@ -0,0 +1,74 @@
+"""Tests for the stage output cache."""
+
+import os
+
+import cache
+import mine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write(path, text):  # type: ignore
+    with open(path, "w", encoding="utf-8") as out_fp:
+        out_fp.write(text)
+
+
+def read(path):  # type: ignore
+    with open(path, "r", encoding="utf-8") as in_fp:
+        return in_fp.read()
+
+
+def test_hit_and_miss(tmp_path, monkeypatch):  # type: ignore
+    """A stage reruns only when its inputs, params or modules change."""
+    monkeypatch.chdir(tmp_path)
+    runs = []
+
+    def stage():  # type: ignore
+        runs.append(read("in"))
+        write("out", read("in").upper())
+
+    write("in", "first")
+    assert not cache.cached("stage", stage, ["in"], ["out"], {"n": 1}, [cache])
+    os.remove("out")
+    assert cache.cached("stage", stage, ["in"], ["out"], {"n": 1}, [cache])
+    assert read("out") == "FIRST"
+
+    assert not cache.cached("stage", stage, ["in"], ["out"], {"n": 2}, [cache])
+    write("in", "second")
+    assert not cache.cached("stage", stage, ["in"], ["out"], {"n": 2}, [cache])
+    assert read("out") == "SECOND"
+    assert runs == ["first", "first", "second"]
+
+
+def test_eviction_keeps_shared_blobs(tmp_path, monkeypatch):  # type: ignore
+    """Least recently used entries go first, but blobs they share stay."""
+    monkeypatch.chdir(tmp_path)
+    write("shared", "s" * 100)
+
+    for name in ["old", "new"]:
+        write(name, name * 100)
+        cache.store(name, ["shared", name])
+        entry = os.path.join(cache.CACHE_DIR, "entries", name + ".json")
+        os.utime(entry, (1, 1 if name == "old" else 2))
+
+    cache.evict(550)
+
+    assert not cache.restore("old", ["shared", "old"])
+    assert cache.restore("new", ["shared", "new"])
+    assert read("shared") == "s" * 100
+    assert not os.path.exists(cache._blob_path(cache.file_hash("old")))
+
+
+def test_key_depends_on_tweet_module(tmp_path, monkeypatch):  # type: ignore
+    """Output pickled with a Tweet class from another module isn't reused."""
+    monkeypatch.chdir(tmp_path)
+    keys = []
+    monkeypatch.setattr(cache, "cached", lambda stage, f, i, o, params, m: keys.append(params))
+
+    mine.mine_tweets_cached(os.path.join(ROOT, "cache.py"), "_tweets", "_grams")
+    monkeypatch.setattr(mine.Tweet, "__module__", "__main__")
+    mine.mine_tweets_cached(os.path.join(ROOT, "cache.py"), "_tweets", "_grams")
+
+    assert keys[0]["Tweet"] == "mine.Tweet"
+    assert keys[0] != keys[1]
+
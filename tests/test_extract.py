@@ -0,0 +1,72 @@
+"""Tests for resumable extraction."""
+
+import extract
+
+
+def walk(pages):  # type: ignore
+    """Feed pages of ids through a fresh cursor, returning each request's bounds."""
+    cursor = {}  # type: ignore
+    backfill = True
+    requests = []
+    for ids in pages:
+        requests.append((backfill, extract.next_page(cursor, backfill)))
+        backfill = extract.advance_cursor(cursor, backfill, ids)
+    return cursor, requests
+
+
+def test_backfill_then_catch_up():  # type: ignore
+    """Backfill pages downwards, then only ask for newer Tweets once exhausted."""
+    cursor, requests = walk([[100, 99], [98, 97], [], [], [105, 101], []])
+
+    assert requests == [
+        (True, {}),
+        (True, {"max_id": 98}),
+        (True, {"max_id": 96}),
+        (False, {"since_id": 100}),
+        (False, {"since_id": 100}),
+        (False, {"since_id": 105}),
+    ]
+    assert cursor == {"oldest": 97, "newest": 105, "exhausted": 1}
+
+
+def test_gap_is_paged_before_merging():  # type: ignore
+    """A gap above newest is paged downwards and only merged once closed."""
+    cursor = {"oldest": 10, "newest": 20, "exhausted": 1}
+
+    assert not extract.advance_cursor(cursor, False, [50, 40])
+    assert cursor["newest"] == 20
+    assert extract.next_page(cursor, False) == {"since_id": 20, "max_id": 39}
+
+    # Reaching the bottom of the gap merges it without another request
+    assert not extract.advance_cursor(cursor, False, [39, 21])
+    assert cursor == {"oldest": 10, "newest": 50, "exhausted": 1}
+
+
+def test_unexhausted_backfill_resumes():  # type: ignore
+    """Closing a gap goes back to backfilling until older Tweets run out."""
+    cursor = {"oldest": 10, "newest": 20}
+
+    assert extract.advance_cursor(cursor, False, [])
+    assert extract.next_page(cursor, True) == {"max_id": 9}
+
+
+def test_stale_sidecars_are_reset(tmp_path):  # type: ignore
+    """Sidecars of a deleted outfile are not trusted."""
+    outfile = str(tmp_path / "extract.csv")
+    extract.save_cursors(extract.cursor_path(outfile), {"q": {"newest": 5}})
+    with open(extract.ids_path(outfile), "w", encoding="utf-8") as ids_fp:
+        ids_fp.write("5\n")
+
+    extract.reset_sidecars(outfile)
+
+    assert extract.load_cursors(extract.cursor_path(outfile)) == {}
+    assert extract.load_seen_ids(extract.ids_path(outfile), outfile) == set()
+
+
+def test_seen_ids_rebuilt_from_outfile(tmp_path):  # type: ignore
+    """Outfiles without an id index get one from their rows."""
+    outfile = tmp_path / "extract.csv"
+    outfile.write_text('full_text,a,b,id\n"two\nlines",x,y,7\nhi,x,y,8\n', encoding="utf-8")
+
+    assert extract.load_seen_ids(extract.ids_path(str(outfile)), str(outfile)) == {"7", "8"}
+    assert (tmp_path / "extract.csv.ids").exists()
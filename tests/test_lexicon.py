@@ -0,0 +1,49 @@
+"""Tests for the compiled tag and lemma lexicon."""
+
+import logging
+
+import lexicon
+import sstable
+
+
+def test_lexicon_matches_nltk(tmp_path, fake_nltk, monkeypatch):  # type: ignore
+    """Compiled tags and lemmas give NLTK's output, falling back on misses."""
+    calls = []
+
+    def tag(tokens):  # type: ignore
+        """Tag "love" by position, and everything else by length."""
+        calls.append(tokens)
+        return [
+            (t, ["VB", "NN"][i % 2] if t == "love" else "NN" if len(t) > 4 else "VB")
+            for i, t in enumerate(tokens)
+        ]
+
+    monkeypatch.setattr(lexicon, "nltk_pos_tag", tag)
+    monkeypatch.setattr(lexicon, "_table", None)
+    path = str(tmp_path / "lexicon")
+    lexicon.build_lexicon([], path)
+    table = sstable.Table(path)
+
+    # Only tokens with a single tag in every context are compiled
+    assert table.get(lexicon.TAG_PREFIX + b"love") is None
+    assert table.get(lexicon.TAG_PREFIX + b"happy") == b"NN"
+
+    lexicon.load(path)
+    calls.clear()
+    assert lexicon.pos_tag(["happy", "day"]) == [("happy", "NN"), ("day", "VB")]
+    assert not calls
+    assert lexicon.pos_tag(["happy", "unseen"]) == tag(["happy", "unseen"])
+    assert lexicon.lemmatize("people", "n") == "people"
+    assert lexicon.lemmatize("unseens", "n") == "unseen"
+
+
+def test_missing_lexicon_warns(tmp_path, monkeypatch, caplog):  # type: ignore
+    """A mistyped --lexicon is reported rather than silently ignored."""
+    monkeypatch.setattr(lexicon, "_table", None)
+
+    with caplog.at_level(logging.WARNING, logger="lexicon"):
+        lexicon.load(str(tmp_path / "missing"))
+        lexicon.load("")
+
+    assert len(caplog.records) == 1
+    assert lexicon.loaded_path() == ""
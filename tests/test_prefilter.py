@@ -0,0 +1,41 @@
+"""Tests for the preprocess subjectivity prefilter and its audit."""
+
+import logging
+
+import mine
+import preprocess
+
+
+def test_polarity_lexicon(fake_nltk):  # type: ignore
+    """Words lean the way the samples do, and every counted word recurs."""
+    polarities = preprocess.polarity_lexicon()
+
+    assert all(polarities[word] > 0 for word in ["good", "bad", "happy"])
+    assert all(polarities[word] < 0 for word in ["sad", "great", "awful"])
+    assert "unseen" not in polarities
+
+
+def test_estimate_subjectivity(fake_nltk):  # type: ignore
+    """Estimates grow with sentiment, ignore repeats and stay in [0, 1)."""
+    polarities = preprocess.polarity_lexicon()
+    estimate = lambda text: preprocess.estimate_subjectivity(text, polarities)  # noqa: E731
+
+    assert estimate("") == estimate("unseen words") == 0.0
+    assert estimate("Good good GOOD") == estimate("good")
+    assert estimate("good") < estimate("good happy") < 1.0
+    assert estimate("sad awful") == estimate("sad awful sad") > estimate("sad good")
+
+
+def test_log_audit(caplog):  # type: ignore
+    """Precision and recall of the prefilter's drops are logged."""
+    caplog.set_level(logging.INFO)
+    mine.log_audit({(True, True): 3, (True, False): 1, (False, True): 6, (False, False): 90})
+
+    assert "3 of 4 drops were rejected here too (precision 0.750)" in caplog.text
+    assert "3 of 9 rejections were dropped early (recall 0.333)" in caplog.text
+    assert "1 subjective Tweets would have been lost" in caplog.text
+
+    caplog.clear()
+    mine.log_audit({})
+    assert "0 of 0 drops were rejected here too (precision 1.000)" in caplog.text
+    assert "0 of 0 rejections were dropped early (recall 1.000)" in caplog.text
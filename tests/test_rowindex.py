@@ -0,0 +1,120 @@
+"""Tests for the CSV row index."""
+
+import csv
+import io
+
+import rowindex
+
+RECORDS = [
+    ["plain", "1"],
+    ["two\nlines", "2"],
+    ['say ""hi""', "3"],
+    ['"quoted\nand doubled"', "4"],
+    ["last", "5"],
+]
+
+
+def write_csv(path, records):  # type: ignore
+    """Write records the way the pipeline's csv.writer does."""
+    with open(path, "w", encoding="utf-8", newline="") as csv_fp:
+        csv.writer(csv_fp).writerows(records)
+
+
+def test_quoted_newlines_and_doubled_quotes(tmp_path):  # type: ignore
+    """Only newlines outside quotes end a record."""
+    path = str(tmp_path / "rows.csv")
+    write_csv(path, RECORDS)
+
+    row_index = rowindex.RowIndex(path)
+
+    assert len(row_index) == len(RECORDS)
+    assert list(row_index.rows()) == RECORDS
+    assert list(row_index.rows(1, 3)) == RECORDS[1:3]
+    assert list(row_index.rows(4, 5)) == RECORDS[4:]
+
+
+def test_appended_rows_are_indexed(tmp_path):  # type: ignore
+    """A refresh only scans what was appended since the last one."""
+    path = str(tmp_path / "rows.csv")
+    write_csv(path, RECORDS[:2])
+    row_index = rowindex.RowIndex(path)
+
+    with open(path, "a", encoding="utf-8", newline="") as csv_fp:
+        csv.writer(csv_fp).writerows(RECORDS[2:])
+    row_index.refresh()
+
+    assert len(row_index) == len(RECORDS)
+    assert list(rowindex.RowIndex(path).rows(2)) == RECORDS[2:]
+
+
+def test_interrupted_scan_is_cut_off(tmp_path):  # type: ignore
+    """Offsets appended without a header update are dropped on open."""
+    path = str(tmp_path / "rows.csv")
+    write_csv(path, RECORDS)
+    rowindex.RowIndex(path)
+
+    with open(rowindex.index_path(path), "ab") as index_fp:
+        for offset in [1, 2, 3]:
+            index_fp.write(rowindex.OFFSET.pack(offset))
+
+    row_index = rowindex.RowIndex(path)
+    assert len(row_index) == len(RECORDS)
+    assert list(row_index.rows()) == RECORDS
+
+
+def test_rewritten_csv_is_reindexed(tmp_path):  # type: ignore
+    """An index whose CSV changed underneath it is rebuilt."""
+    path = str(tmp_path / "rows.csv")
+    write_csv(path, RECORDS)
+    rowindex.RowIndex(path)
+
+    write_csv(path, RECORDS[::-1])
+
+    assert list(rowindex.RowIndex(path).rows()) == RECORDS[::-1]
+
+
+def test_last_record_without_newline(tmp_path):  # type: ignore
+    """A final record missing its newline is still read."""
+    path = tmp_path / "rows.csv"
+    path.write_text("x,1\ny,2\nz,3", encoding="utf-8")
+
+    row_index = rowindex.RowIndex(str(path))
+
+    assert len(row_index) == 2
+    assert list(row_index.rows()) == [["x", "1"], ["y", "2"], ["z", "3"]]
+    assert list(row_index.rows(2)) == [["z", "3"]]
+    assert list(row_index.rows(0, 2)) == [["x", "1"], ["y", "2"]]
+
+
+def test_unwritable_index_falls_back_to_memory(tmp_path, monkeypatch):  # type: ignore
+    """Inputs whose sidecar can't be written are still readable."""
+    path = str(tmp_path / "rows.csv")
+    write_csv(path, RECORDS)
+    monkeypatch.setattr(rowindex, "index_path", lambda path: str(tmp_path / "missing" / "x"))
+
+    row_index = rowindex.RowIndex(path)
+
+    assert len(row_index) == len(RECORDS)
+    assert list(row_index.rows(1, 3)) == RECORDS[1:3]
+    assert [r for s, e in row_index.split(2) for r in rowindex.read_range(path, s, e)] == RECORDS
+
+
+def test_split_and_read_range(tmp_path):  # type: ignore
+    """Byte ranges are record-aligned and cover every record once."""
+    path = str(tmp_path / "rows.csv")
+    write_csv(path, RECORDS * 20)
+    row_index = rowindex.RowIndex(path)
+
+    for parts in [1, 3, 7]:
+        ranges = row_index.split(parts)
+        assert ranges[0][0] == 0
+        assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+        records = [r for start, end in ranges for r in rowindex.read_range(path, start, end)]
+        assert records == RECORDS * 20
+
+    with open(path, "rb") as csv_fp:
+        data = csv_fp.read()
+    start, end = ranges[1]
+    assert list(rowindex.read_range(path, start, end)) == list(
+        csv.reader(io.StringIO(data[start:end].decode("utf-8"), newline=""))
+    )
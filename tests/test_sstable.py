@@ -0,0 +1,57 @@
+"""Tests for the sorted table and the postings drill-down."""
+
+import csv
+
+import analyze
+import sstable
+from mine import gram_key
+
+
+def test_pack_ids_round_trip():  # type: ignore
+    """Ids survive delta and varint encoding, including multi-byte deltas."""
+    for ids in [[], [0], [1, 2, 3], [5, 127, 128, 300, 2 ** 40, 2 ** 63]]:
+        assert sstable.unpack_ids(sstable.pack_ids(ids)) == ids
+
+    assert sstable.pack_ids([1, 2, 3]) == b"\x01\x01\x01"
+    assert len(sstable.pack_ids([128])) == 2
+
+
+def test_table_get(tmp_path):  # type: ignore
+    """Every key is found, and keys around and between them are not."""
+    path = str(tmp_path / "table")
+    items = {f"key{i:03}".encode(): str(i).encode() * (i % 3) for i in range(0, 200, 2)}
+
+    assert sstable.write_table(path, reversed(list(items.items()))) == len(items)
+
+    table = sstable.Table(path)
+    assert len(table) == len(items)
+    for key, value in items.items():
+        assert table.get(key) == value
+    for missing in [b"", b"a", b"key001", b"key199", b"key1000", b"zzz"]:
+        assert table.get(missing) is None
+    table.close()
+
+
+def test_presorted_and_empty_tables(tmp_path):  # type: ignore
+    """Streamed and empty tables read back like sorted ones."""
+    items = [(b"a", b"1"), (b"b", b""), (b"c", b"333")]
+    sstable.write_table(str(tmp_path / "presorted"), iter(items), presorted=True)
+    sstable.write_table(str(tmp_path / "empty"), [])
+
+    table = sstable.Table(str(tmp_path / "presorted"))
+    assert [table.get(key) for key, _ in items] == [value for _, value in items]
+    assert sstable.Table(str(tmp_path / "empty")).get(b"a") is None
+
+
+def test_fetch_examples(tmp_path):  # type: ignore
+    """An aspect's posted rows are read back from the source CSV."""
+    source = str(tmp_path / "source.csv")
+    with open(source, "w", encoding="utf-8", newline="") as csv_fp:
+        csv.writer(csv_fp).writerows([[f"tweet {i}"] for i in range(10)])
+    postings = str(tmp_path / "postings")
+    sstable.write_table(postings, [(gram_key(2, ("stay", "home")), sstable.pack_ids([1, 4, 7]))])
+
+    rows = analyze.fetch_examples(postings, source, "Stay Home", limit=2)
+
+    assert rows == [["tweet 1"], ["tweet 4"]]
+    assert analyze.fetch_examples(postings, source, "mask") == []
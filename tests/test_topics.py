@@ -0,0 +1,92 @@
+"""Tests for multi-topic extraction output."""
+
+import csv
+import json
+
+import analyze
+import extract
+import mine
+import preprocess
+from conftest import extract_row
+
+
+def test_match_topics_hashtags():  # type: ignore
+    """Hashtags match topics run together or in camel case."""
+    topics = ["stay home", "mask", "covid 19"]
+    assert extract.match_topics("Please #StayHome and wear a mask", topics) == [
+        "stay home",
+        "mask",
+    ]
+    assert extract.match_topics("#stayhome #COVID19", topics) == ["stay home", "covid 19"]
+    assert extract.match_topics("nothing to see here", topics) == []
+
+
+def test_build_queries_keeps_topic_cursors():  # type: ignore
+    """A new topic gets its own search instead of resetting the others."""
+    cursors = {"stay home": {"newest": 5}, "mask": {"newest": 5}}
+    assert extract.build_queries(["stay home", "mask", "vaccine"], cursors) == [
+        ("(stay home) OR mask", ["stay home", "mask"]),
+        ("vaccine", ["vaccine"]),
+    ]
+
+
+def test_topics_survive_preprocess(tmp_path, fake_nltk):  # type: ignore
+    """A multi-topic extract CSV goes through preprocess and mine.Tweet."""
+    topics = ["stay home", "mask"]
+    infile = str(tmp_path / "extract.csv")
+    outfile = str(tmp_path / "preprocess.csv")
+    texts = ["happy to #StayHome today", "wear a mask at home", "great day"]
+
+    with open(infile, "w", encoding="utf-8") as extract_fp:
+        writer = csv.writer(extract_fp)
+        writer.writerow(["full_text", "created_at", "source", "id"] + [""] * 12 + ["topics"])
+        for i, text in enumerate(texts):
+            row = extract_row(100 + i, text)
+            writer.writerow(row + [json.dumps(extract.match_topics(text, topics))])
+
+    preprocess.preprocess_tweets(infile, outfile)
+
+    with open(outfile, "r", encoding="utf-8") as csv_fp:
+        tweets = [mine.Tweet(row) for row in csv.reader(csv_fp)]
+
+    assert [tweet.tweet_id for tweet in tweets] == ["100", "101", "102"]
+    assert [tweet.topics for tweet in tweets] == [["stay home"], ["mask"], []]
+
+
+def test_topics_retagged_and_reported_in_one_pass(tmp_path, fake_nltk, monkeypatch):  # type: ignore
+    """Tweets extracted before a topic existed count towards it, even a tiny one."""
+    infile = str(tmp_path / "extract.csv")
+    with open(infile, "w", encoding="utf-8") as extract_fp:
+        writer = csv.writer(extract_fp)
+        for i in range(30):
+            text = f"good day number {i} happy" + (" mask" if i == 7 else "")
+            writer.writerow(extract_row(100 + i, text))
+
+    paths = {name: str(tmp_path / name) for name in ["preprocess", "tweets", "grams", "out"]}
+    preprocess.preprocess_tweets(infile, paths["preprocess"], topics=["mask"])
+    mine.mine_tweets(
+        paths["preprocess"],
+        paths["tweets"],
+        paths["grams"],
+        topics=["mask"],
+        classifier=mine.train_classifier(),
+    )
+
+    # Every report shares one load of the Tweets
+    loads = []
+    original = analyze.pickle.load
+
+    def counting_load(handle):  # type: ignore
+        loads.append(handle.name)
+        return original(handle)
+
+    monkeypatch.setattr(analyze.pickle, "load", counting_load)
+    analyze.analyze_tweets(paths["tweets"], paths["grams"], paths["out"], ["mask"])
+
+    assert loads.count(paths["tweets"]) == 1
+    with open(mine.topic_path(paths["out"], "mask"), encoding="utf-8") as report_fp:
+        rows = list(csv.reader(report_fp))
+    assert {row[1] for row in rows if row[0] == "4"} == {
+        "good day number happy",
+        "day number happy mask",
+    }